@@ -1,15 +1,12 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Optional
 
 from pymongo import MongoClient
 from pymongo.database import Database
-from dotenv import load_dotenv
 import os
 
-
-load_dotenv()
-
 _client: Optional[MongoClient] = None
 
 
@@ -17,10 +14,23 @@ def get_client() -> MongoClient:
     global _client
     if _client is None:
         uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-        _client = MongoClient(uri, appname="independent-agent")
+        # One pooled client per process; reused across every agent run
+        _client = MongoClient(
+            uri,
+            appname="independent-agent",
+            # Agent runs are offloaded to threadpool workers; give each one a connection instead of queueing
+            maxPoolSize=max(50, int(os.getenv("THREADPOOL_SIZE", "64"))),
+            minPoolSize=5,
+            maxIdleTimeMS=300_000,
+            socketTimeoutMS=20000,
+            retryWrites=True,
+            compressors="zstd,zlib",
+            zlibCompressionLevel=6,
+        )
     return _client
 
 
+@lru_cache(maxsize=1)
 def get_db() -> Database:
     db_name = os.getenv("MONGO_DB_NAME", "misogi")
     return get_client()[db_name]
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Dict, Any
 
 from langgraph.graph import StateGraph, END
@@ -34,8 +35,14 @@ def build_graph():
     return graph.compile()
 
 
+@lru_cache(maxsize=1)
+def get_compiled_graph():
+    # Compile once per process; the graph is stateless and safe to reuse across runs
+    return build_graph()
+
+
 def run(patient: Dict[str, Any], campaign: Dict[str, Any]) -> Dict[str, Any]:
-    app = build_graph()
+    app = get_compiled_graph()
     return app.invoke({"patient": patient, "campaign": campaign})
 
 
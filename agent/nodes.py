@@ -1,17 +1,31 @@
 from __future__ import annotations
 
 from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 from bson import ObjectId
-from dotenv import load_dotenv, find_dotenv
 
 from agent.db import get_db
 from agent.services import EmailService, LLMService
+from services.http_client import DEFAULT_TIMEOUT, get_http_session
 from zoneinfo import ZoneInfo
+from functools import lru_cache
 import os
 
-load_dotenv(find_dotenv(), override=True)
+
+@lru_cache(maxsize=8)
+def _tz(name: str) -> ZoneInfo:
+    # ZoneInfo construction parses tzdata; cache per name (falls back to UTC)
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return ZoneInfo("UTC")
+
+
+@lru_cache(maxsize=1)
+def _clinic_tz() -> ZoneInfo:
+    # Clinic timezone from TZ, resolved once per process
+    return _tz(os.getenv("TZ", "UTC"))
 
 
 def node_follow_up(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -42,7 +56,7 @@ def node_follow_up(state: Dict[str, Any]) -> Dict[str, Any]:
         return state
 
     llm = LLMService()
-    tz = ZoneInfo(os.getenv("TZ", "UTC"))
+    tz = _clinic_tz()
 
     # Appointment reminder only once
     if campaign_type_value == "APPOINTMENT_REMINDER":
@@ -54,7 +68,7 @@ def node_follow_up(state: Dict[str, Any]) -> Dict[str, Any]:
             db = get_db()
             raw_cid = campaign.get("_id")
             cid = raw_cid if isinstance(raw_cid, ObjectId) else ObjectId(str(raw_cid))
-            appt = db.appointments.find_one({"campaign_id": cid})
+            appt = db.appointments.find_one({"campaign_id": cid}, {"appointment_date": 1, "consulting_doctor": 1})
             appt_dt = appt.get("appointment_date") if appt else None
             doctor_name_value = (appt or {}).get("consulting_doctor")
             print(
@@ -66,16 +80,14 @@ def node_follow_up(state: Dict[str, Any]) -> Dict[str, Any]:
                 },
             )
             if isinstance(appt_dt, datetime):
-                from zoneinfo import ZoneInfo as _Z
-                local_dt = appt_dt.replace(tzinfo=_Z("UTC")).astimezone(tz)
+                local_dt = appt_dt.replace(tzinfo=timezone.utc).astimezone(tz)
                 local_dt_obj = local_dt
                 local_dt_str = local_dt.strftime("%a, %d %b %Y %I:%M %p %Z")
         except Exception:
             # Fallback to next_attempt_at if appointment not found
             try:
                 if isinstance(next_attempt_at, datetime):
-                    from zoneinfo import ZoneInfo as _Z
-                    local_dt = next_attempt_at.replace(tzinfo=_Z("UTC")).astimezone(tz)
+                    local_dt = next_attempt_at.replace(tzinfo=timezone.utc).astimezone(tz)
                     local_dt_obj = local_dt
                     local_dt_str = local_dt.strftime("%a, %d %b %Y %I:%M %p %Z")
             except Exception:
@@ -211,7 +223,7 @@ def node_send_email(state: Dict[str, Any]) -> Dict[str, Any]:
             "campaign_id": ObjectId(state["campaign"]["_id"]),
             "direction": "outgoing",
             "content": state.get("email_body", ""),
-            "timestamp": datetime.utcnow(),
+            "timestamp": datetime.now(timezone.utc),
         }
     )
     print(
@@ -224,19 +236,31 @@ def node_send_email(state: Dict[str, Any]) -> Dict[str, Any]:
 def node_ai_summary(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign_id = ObjectId(state["campaign"]["_id"])
     db = get_db()
-    interactions = list(db.interactions.find({"campaign_id": campaign_id}).sort("timestamp", 1))
-    chat_items: List[Dict[str, Any]] = [
-        {
-            "timestamp_iso": (i.get("timestamp").isoformat() if hasattr(i.get("timestamp"), "isoformat") else str(i.get("timestamp"))),
-            "direction": i.get("direction"),
-            "content": i.get("content", ""),
-        }
-        for i in interactions
-    ]
+    # Iterate the cursor directly (batched) rather than materializing raw docs before formatting
+    interactions = (
+        db.interactions.find({"campaign_id": campaign_id}, {"_id": 0, "timestamp": 1, "direction": 1, "content": 1})
+        .sort("timestamp", 1)
+        .batch_size(50)
+    )
+    chat_items: List[Dict[str, Any]] = []
+    last_ts = None
+    for i in interactions:
+        last_ts = i.get("timestamp")
+        chat_items.append(
+            {
+                "timestamp_iso": (last_ts.isoformat() if hasattr(last_ts, "isoformat") else str(last_ts)),
+                "direction": i.get("direction"),
+                "content": i.get("content", ""),
+            }
+        )
 
     llm = LLMService()
     summary = llm.summarize_formatted(chat_items)
-    db.campaigns.update_one({"_id": campaign_id}, {"$set": {"engagement_summary": summary}})
+    summary_set: Dict[str, Any] = {"engagement_summary": summary}
+    if isinstance(last_ts, datetime):
+        # Lets the reply agent extend this summary with only the messages that follow
+        summary_set["last_summary_at"] = last_ts
+    db.campaigns.update_one({"_id": campaign_id}, {"$set": summary_set})
 
     # increment attempt and schedule next per type
     camp = db.campaigns.find_one({"_id": campaign_id}, {"campaign_type": 1, "follow_up_details": 1})
@@ -257,7 +281,7 @@ def node_ai_summary(state: Dict[str, Any]) -> Dict[str, Any]:
     if attempts_made < max_attempts and days > 0:
         db.campaigns.update_one(
             {"_id": campaign_id},
-            {"$set": {"follow_up_details.next_attempt_at": datetime.utcnow() + timedelta(days=days)}},
+            {"$set": {"follow_up_details.next_attempt_at": datetime.now(timezone.utc) + timedelta(days=days)}},
         )
 
     updated = db.campaigns.find_one({"_id": campaign_id}, {"follow_up_details": 1, "engagement_summary": 1})
@@ -285,8 +309,7 @@ def node_call_patient(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign = state.get("campaign") or {}
     authorization = os.getenv("AUTHORIZATION", "")
 
-    import requests
-    response = requests.post(
+    response = get_http_session().post(
     "https://api.vapi.ai/call",
     headers={
         "Authorization": f"Bearer {authorization}"
@@ -304,6 +327,7 @@ def node_call_patient(state: Dict[str, Any]) -> Dict[str, Any]:
         "service_name": campaign.get("service_name", "")}
         }
     },
+    timeout=DEFAULT_TIMEOUT,
     )
     
 
@@ -319,7 +343,7 @@ def node_call_patient(state: Dict[str, Any]) -> Dict[str, Any]:
             "campaign_id": ObjectId(state["campaign"]["_id"]),
             "direction": "outgoing",
             "content": result_text,
-            "timestamp": datetime.utcnow(),
+            "timestamp": datetime.now(timezone.utc),
         }
     )
     print(
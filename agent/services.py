@@ -1,19 +1,39 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import queue
+import socket
+import threading
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from dotenv import load_dotenv
 import smtplib
 from email.message import EmailMessage
 from email.utils import make_msgid
+from cachetools import LRUCache
 from openai import OpenAI
 
+# Small pool of authenticated SMTP sessions shared by every EmailService (nodes build one per send):
+# up to _SMTP_POOL_SIZE sends run concurrently, idle sessions wait in the queue keyed by
+# (host, port, user), and each is noop()-checked before reuse
+_SMTP_POOL_SIZE = min(4, max(2, int(os.getenv("SMTP_POOL_SIZE", "3"))))
+_smtp_idle: queue.Queue = queue.Queue(maxsize=_SMTP_POOL_SIZE)
+_smtp_slots = threading.BoundedSemaphore(_SMTP_POOL_SIZE)
 
-load_dotenv()
+# Formatted summaries keyed by (model, blake2b of the history text) so reruns and retries over an
+# unchanged conversation reuse the earlier completion instead of paying for another one
+_summary_cache: LRUCache = LRUCache(maxsize=512)
+_summary_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _local_fqdn() -> str:
+    # make_msgid() would otherwise resolve the FQDN (possibly a reverse DNS lookup) on every send
+    return socket.getfqdn()
 
 
 class EmailService:
@@ -25,6 +45,7 @@ class EmailService:
         self.smtp_pass = os.getenv("SMTP_PASSWORD")
         self.from_email = os.getenv("SMTP_FROM_EMAIL", self.smtp_user)
         self.from_name = os.getenv("SMTP_FROM_NAME", "Clinic")
+        self._msgid_domain = self.from_email.split("@", 1)[1] if "@" in (self.from_email or "") else _local_fqdn()
 
     def send(
         self,
@@ -56,7 +77,7 @@ class EmailService:
             if references:
                 msg["References"] = references
 
-            message_id = make_msgid()
+            message_id = make_msgid(domain=self._msgid_domain)
             msg["Message-ID"] = message_id
 
             if html:
@@ -68,18 +89,80 @@ class EmailService:
             if reply_to:
                 msg["Reply-To"] = reply_to
 
-            with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30) as s:
-                s.ehlo()
-                s.starttls()
-                s.ehlo()
-                s.login(self.smtp_user, self.smtp_pass)
-                s.send_message(msg)
+            self._send_pooled(msg)
 
             print("email_send")
             return True, message_id
         except Exception as exc:  # pragma: no cover
             return False, str(exc)
 
+    def _connect(self) -> smtplib.SMTP:
+        s = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
+        try:
+            s.ehlo()
+            s.starttls()
+            s.ehlo()
+            s.login(self.smtp_user, self.smtp_pass)
+        except Exception:
+            s.close()
+            raise
+        return s
+
+    def _checkout(self, key: tuple[str, int, str]) -> smtplib.SMTP:
+        # Reuse an idle session that still answers NOOP; dead or foreign ones are dropped without QUIT
+        while True:
+            try:
+                idle_key, s = _smtp_idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if idle_key != key:
+                _close_quietly(s)
+                continue
+            try:
+                if s.noop()[0] == 250:
+                    return s
+            except Exception:
+                pass
+            s.close()
+
+    def _send_pooled(self, msg: EmailMessage) -> None:
+        key = (self.smtp_host, self.smtp_port, self.smtp_user or "")
+        with _smtp_slots:
+            s = self._checkout(key)
+            try:
+                try:
+                    s.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # Dropped between NOOP and send; re-dial once
+                    s.close()
+                    s = self._connect()
+                    s.send_message(msg)
+            except Exception:
+                # Unknown session state after a failure; never return it to the pool
+                s.close()
+                raise
+            try:
+                _smtp_idle.put_nowait((key, s))
+            except queue.Full:
+                _close_quietly(s)
+
+
+def _close_quietly(s: smtplib.SMTP) -> None:
+    try:
+        s.quit()
+    except Exception:
+        s.close()
+
+
+def close_smtp_pool() -> None:
+    # Shutdown hook: QUIT every idle pooled session
+    while True:
+        try:
+            _, s = _smtp_idle.get_nowait()
+        except queue.Empty:
+            return
+        _close_quietly(s)
+
 
 class LLMService:
     def __init__(self) -> None:
@@ -130,6 +213,11 @@ class LLMService:
         # chat_items: [{timestamp_iso, direction, content}]
         history_lines = [f"{i['timestamp_iso']} | {i['direction']}: {i['content']}" for i in chat_items]
         history = "\n".join(history_lines)
+        cache_key = (self.model, hashlib.blake2b(history.encode("utf-8"), digest_size=16).hexdigest())
+        with _summary_cache_lock:
+            cached = _summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
         format_spec = (
             "Overall Summary-\n"
             "<one-paragraph overall summary>\n\n"
@@ -153,7 +241,10 @@ class LLMService:
             temperature=0.2,
             max_tokens=500,
         )
-        return resp.choices[0].message.content.strip()
+        summary = resp.choices[0].message.content.strip()
+        with _summary_cache_lock:
+            _summary_cache[cache_key] = summary
+        return summary
 
     def generate_campaign_message(
         self,
@@ -1,15 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timezone, timedelta
 from math import ceil
-from typing import Any, Dict, List
+from collections import Counter
+from typing import Any, Dict, Iterable, List
 
 from bson import ObjectId
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
+from pymongo.errors import DuplicateKeyError
 
-from db.database import get_database
-from repositories.base import BaseRepository
+from api.v1.responses import MongoJSONResponse
+from db.database import EMAIL_COLLATION, get_repo
+from repositories.base import BaseRepository, utcnow
 from models.campaign import (
     CampaignType,
     CampaignStatus,
@@ -36,11 +40,32 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_user)])
 
 
-@router.get("/dashboard-stats")
-async def dashboard_stats() -> Dict[str, Any]:
-    db = await get_database()
-    repo = BaseRepository(db)
+# Enum values resolved once for the dashboard's per-campaign tallies
+_RECOVERY = CampaignType.RECOVERY.value
+_RECALL = CampaignType.RECALL.value
+_RECOVERED = CampaignStatus.RECOVERED.value
+_RE_ENGAGED = CampaignStatus.RE_ENGAGED.value
+_HANDOFF_REQUIRED = CampaignStatus.HANDOFF_REQUIRED.value
+_FAILED = CampaignStatus.RECOVERY_FAILED.value
+_DECLINED = CampaignStatus.RECOVERY_DECLINED.value
+_ACTIVE_STATUSES = (CampaignStatus.ATTEMPTING_RECOVERY.value, CampaignStatus.RE_ENGAGED.value)
 
+
+def _type_status_counts(items: Iterable[Dict[str, Any]]) -> Counter:
+    return Counter((c.get("campaign_type"), c.get("status")) for c in items)
+
+
+def _status_total(counts: Counter, status: str) -> int:
+    return sum(n for (_, st), n in counts.items() if st == status)
+
+
+def _recovered_rate(counts: Counter, campaign_type: str) -> float:
+    den = sum(n for (ct, _), n in counts.items() if ct == campaign_type)
+    return (counts[(campaign_type, _RECOVERED)] / den * 100.0) if den else 0.0
+
+
+@router.get("/dashboard-stats", response_class=MongoJSONResponse)
+async def dashboard_stats(repo: BaseRepository = Depends(get_repo)) -> MongoJSONResponse:
     # KPIs
     now = datetime.now(timezone.utc)
     start_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
@@ -64,10 +89,39 @@ async def dashboard_stats() -> Dict[str, Any]:
                 return None
         return None
 
+    # Time-series window: last 12 months ending with current month
+    def _add_months(dt: datetime, n: int) -> datetime:
+        y = dt.year + (dt.month - 1 + n) // 12
+        m = (dt.month - 1 + n) % 12 + 1
+        return datetime(y, m, 1, tzinfo=timezone.utc)
+
+    start_window = _add_months(start_month, -11)
+
+    # Appointments are only needed for the 12-month window; fetch them once, bounded by
+    # date (supporting both datetime and ISO string storage), instead of scanning the collection.
+    # String dates may be date-only or carry any UTC offset, so their bounds are date prefixes padded
+    # by a day on each side (covers every offset); the exact window is applied below on the parsed _ts
+    window_start_iso = (start_window - timedelta(days=1)).date().isoformat()
+    window_end_iso = (next_month + timedelta(days=1)).date().isoformat()
+    appts = await repo.find_many(
+        "appointments",
+        {
+            "$or": [
+                {"appointment_date": {"$gte": start_window, "$lt": next_month}},
+                {"appointment_date": {"$gte": window_start_iso, "$lt": window_end_iso}},
+            ]
+        },
+        projection={"_id": 0, "appointment_date": 1, "status": 1},
+    )
+
+    # Normalize each appointment date once; the monthly trend below reuses it
+    for appt in appts:
+        appt["_ts"] = _as_utc(appt.get("appointment_date"))
+
     # Appointments booked this month
     booked_month = 0
-    for appt in await repo.find_many("appointments", {}):
-        ts = _as_utc(appt.get("appointment_date"))
+    for appt in appts:
+        ts = appt["_ts"]
         if ts and start_month <= ts < next_month and appt.get("status") == "booked":
             booked_month += 1
 
@@ -89,132 +143,97 @@ async def dashboard_stats() -> Dict[str, Any]:
     )
 
     # Monthly campaign stats (filter in Python to be robust against mixed datetime storage)
-    campaigns = await repo.find_many("campaigns", {})
+    campaigns = await repo.find_many(
+        "campaigns",
+        {},
+        projection={"_id": 0, "status": 1, "campaign_type": 1, "updated_at": 1, "created_at": 1},
+    )
+    # Normalize each campaign's activity time once instead of on every bucketing pass
+    for c in campaigns:
+        c["_ts"] = _as_utc(c.get("updated_at")) or _as_utc(c.get("created_at"))
     monthly: list[Dict[str, Any]] = []
     for c in campaigns:
-        upd = _as_utc(c.get("updated_at")) or _as_utc(c.get("created_at"))
+        upd = c["_ts"]
         if upd and start_month <= upd < next_month:
             monthly.append(c)
 
-    recoveries_month = sum(1 for c in monthly if c.get("status") == CampaignStatus.RECOVERED.value)
-    engaged_month = sum(1 for c in monthly if c.get("status") == CampaignStatus.RE_ENGAGED.value)
+    # Every rate below is a ratio of (campaign_type, status) counts; tally each slice once and look
+    # the numbers up instead of re-scanning the list per metric
+    month_counts = _type_status_counts(monthly)
+    lifetime_counts = _type_status_counts(campaigns)
 
-    # Rates scoped to this month
-    recov_month_den = sum(1 for c in monthly if c.get("campaign_type") == CampaignType.RECOVERY.value)
-    recov_month_num = sum(
-        1
-        for c in monthly
-        if c.get("campaign_type") == CampaignType.RECOVERY.value and c.get("status") == CampaignStatus.RECOVERED.value
-    )
-    recovery_rate = (recov_month_num / recov_month_den * 100.0) if recov_month_den else 0.0
+    recoveries_month = _status_total(month_counts, _RECOVERED)
+    engaged_month = _status_total(month_counts, _RE_ENGAGED)
 
-    recall_month_den = sum(1 for c in monthly if c.get("campaign_type") == CampaignType.RECALL.value)
-    recall_month_num = sum(
-        1
-        for c in monthly
-        if c.get("campaign_type") == CampaignType.RECALL.value and c.get("status") == CampaignStatus.RECOVERED.value
-    )
-    recall_rate = (recall_month_num / recall_month_den * 100.0) if recall_month_den else 0.0
+    # Rates scoped to this month
+    recovery_rate = _recovered_rate(month_counts, _RECOVERY)
+    recall_rate = _recovered_rate(month_counts, _RECALL)
 
     # Lifetime rates (across all history)
-    total_recovery = sum(1 for c in campaigns if c.get("campaign_type") == CampaignType.RECOVERY.value)
-    total_recovery_recovered = sum(
-        1 for c in campaigns if c.get("campaign_type") == CampaignType.RECOVERY.value and c.get("status") == CampaignStatus.RECOVERED.value
-    )
-    lifetime_recovery_rate = (total_recovery_recovered / total_recovery * 100.0) if total_recovery else 0.0
-
-    total_recall = sum(1 for c in campaigns if c.get("campaign_type") == CampaignType.RECALL.value)
-    total_recall_recovered = sum(
-        1 for c in campaigns if c.get("campaign_type") == CampaignType.RECALL.value and c.get("status") == CampaignStatus.RECOVERED.value
-    )
-    lifetime_recall_rate = (total_recall_recovered / total_recall * 100.0) if total_recall else 0.0
+    total_recovery_recovered = lifetime_counts[(_RECOVERY, _RECOVERED)]
+    lifetime_recovery_rate = _recovered_rate(lifetime_counts, _RECOVERY)
+    total_recall_recovered = lifetime_counts[(_RECALL, _RECOVERED)]
+    lifetime_recall_rate = _recovered_rate(lifetime_counts, _RECALL)
 
     # Time-series (last 12 months ending with current month)
     def _month_key(dt: datetime) -> str:
         return f"{dt.year:04d}-{dt.month:02d}"
 
-    def _add_months(dt: datetime, n: int) -> datetime:
-        y = dt.year + (dt.month - 1 + n) // 12
-        m = (dt.month - 1 + n) % 12 + 1
-        return datetime(y, m, 1, tzinfo=timezone.utc)
-
-    months: list[str] = []
-    start_window = _add_months(start_month, -11)
+    # (key, start, end) per month, computed once and shared by both series
+    month_bounds: list[tuple[str, datetime, datetime]] = []
     cursor = start_window
     for _ in range(12):
-        months.append(_month_key(cursor))
-        cursor = _add_months(cursor, 1)
+        nxt = _add_months(cursor, 1)
+        month_bounds.append((_month_key(cursor), cursor, nxt))
+        cursor = nxt
 
     perf_series: list[Dict[str, Any]] = []
-    for mk in months:
-        yr, mo = mk.split("-")
-        s = datetime(int(yr), int(mo), 1, tzinfo=timezone.utc)
-        e = datetime(s.year + (s.month // 12), (s.month % 12) + 1, 1, tzinfo=timezone.utc)
-        slice_items = [c for c in campaigns if (dt := (_as_utc(c.get("updated_at")) or _as_utc(c.get("created_at")))) and s <= dt < e]
-        rec_den = sum(1 for c in slice_items if c.get("campaign_type") == CampaignType.RECOVERY.value)
-        rec_num = sum(1 for c in slice_items if c.get("campaign_type") == CampaignType.RECOVERY.value and c.get("status") == CampaignStatus.RECOVERED.value)
-        rcl_den = sum(1 for c in slice_items if c.get("campaign_type") == CampaignType.RECALL.value)
-        rcl_num = sum(1 for c in slice_items if c.get("campaign_type") == CampaignType.RECALL.value and c.get("status") == CampaignStatus.RECOVERED.value)
+    for mk, s, e in month_bounds:
+        slice_counts = _type_status_counts(c for c in campaigns if (dt := c["_ts"]) and s <= dt < e)
         perf_series.append(
             {
                 "month": mk,
-                "recovery_rate_percent": round((rec_num / rec_den * 100.0) if rec_den else 0.0, 1),
-                "recall_rate_percent": round((rcl_num / rcl_den * 100.0) if rcl_den else 0.0, 1),
-                "recoveries": rec_num,
-                "recall_recoveries": rcl_num,
+                "recovery_rate_percent": round(_recovered_rate(slice_counts, _RECOVERY), 1),
+                "recall_rate_percent": round(_recovered_rate(slice_counts, _RECALL), 1),
+                "recoveries": slice_counts[(_RECOVERY, _RECOVERED)],
+                "recall_recoveries": slice_counts[(_RECALL, _RECOVERED)],
             }
         )
 
     # Campaign breakdown (lifetime and month) for pie charts
-    ACTIVE_STATUSES = {CampaignStatus.ATTEMPTING_RECOVERY.value, CampaignStatus.RE_ENGAGED.value}
-    FAILED = CampaignStatus.RECOVERY_FAILED.value
-    DECLINED = CampaignStatus.RECOVERY_DECLINED.value
-
-    def _breakdown(items: list[Dict[str, Any]]) -> Dict[str, int]:
+    def _breakdown(counts: Counter) -> Dict[str, int]:
         return {
-            "handoffs": sum(1 for c in items if c.get("status") == CampaignStatus.HANDOFF_REQUIRED.value),
-            "active_recovery": sum(1 for c in items if c.get("campaign_type") == CampaignType.RECOVERY.value and c.get("status") in ACTIVE_STATUSES),
-            "active_recall": sum(1 for c in items if c.get("campaign_type") == CampaignType.RECALL.value and c.get("status") in ACTIVE_STATUSES),
-            "recovered": sum(1 for c in items if c.get("status") == CampaignStatus.RECOVERED.value),
-            "failed": sum(1 for c in items if c.get("status") == FAILED),
-            "declined": sum(1 for c in items if c.get("status") == DECLINED),
+            "handoffs": _status_total(counts, _HANDOFF_REQUIRED),
+            "active_recovery": sum(counts[(_RECOVERY, st)] for st in _ACTIVE_STATUSES),
+            "active_recall": sum(counts[(_RECALL, st)] for st in _ACTIVE_STATUSES),
+            "recovered": _status_total(counts, _RECOVERED),
+            "failed": _status_total(counts, _FAILED),
+            "declined": _status_total(counts, _DECLINED),
         }
 
-    breakdown_lifetime = _breakdown(campaigns)
-    breakdown_month = _breakdown(monthly)
+    breakdown_lifetime = _breakdown(lifetime_counts)
+    breakdown_month = _breakdown(month_counts)
 
     # Appointments trend per month (booked/completed/cancelled)
-    appts = await repo.find_many("appointments", {})
     appt_series: list[Dict[str, Any]] = []
-    for mk in months:
-        yr, mo = mk.split("-")
-        s = datetime(int(yr), int(mo), 1, tzinfo=timezone.utc)
-        e = datetime(s.year + (s.month // 12), (s.month % 12) + 1, 1, tzinfo=timezone.utc)
-        slice_appts = [a for a in appts if (dt := _as_utc(a.get("appointment_date"))) and s <= dt < e]
+    for mk, s, e in month_bounds:
+        status_counts = Counter(a.get("status") for a in appts if (dt := a["_ts"]) and s <= dt < e)
         appt_series.append(
             {
                 "month": mk,
-                "booked": sum(1 for a in slice_appts if a.get("status") == "booked"),
-                "completed": sum(1 for a in slice_appts if a.get("status") == "completed"),
-                "cancelled": sum(1 for a in slice_appts if a.get("status") == "cancelled"),
+                "booked": status_counts["booked"],
+                "completed": status_counts["completed"],
+                "cancelled": status_counts["cancelled"],
             }
         )
 
     # Trailing 90 days rates to reflect near-term performance even when current month has no data yet
     window_90_start = now - timedelta(days=90)
-    recent = [
-        c
-        for c in campaigns
-        if (dt := (_as_utc(c.get("updated_at")) or _as_utc(c.get("created_at")))) and window_90_start <= dt <= now
-    ]
-    rec_recent_den = sum(1 for c in recent if c.get("campaign_type") == CampaignType.RECOVERY.value)
-    rec_recent_num = sum(1 for c in recent if c.get("campaign_type") == CampaignType.RECOVERY.value and c.get("status") == CampaignStatus.RECOVERED.value)
-    rcl_recent_den = sum(1 for c in recent if c.get("campaign_type") == CampaignType.RECALL.value)
-    rcl_recent_num = sum(1 for c in recent if c.get("campaign_type") == CampaignType.RECALL.value and c.get("status") == CampaignStatus.RECOVERED.value)
-    recovery_rate_90d = (rec_recent_num / rec_recent_den * 100.0) if rec_recent_den else 0.0
-    recall_rate_90d = (rcl_recent_num / rcl_recent_den * 100.0) if rcl_recent_den else 0.0
-
-    return {
+    recent_counts = _type_status_counts(c for c in campaigns if (dt := c["_ts"]) and window_90_start <= dt <= now)
+    recovery_rate_90d = _recovered_rate(recent_counts, _RECOVERY)
+    recall_rate_90d = _recovered_rate(recent_counts, _RECALL)
+
+    return MongoJSONResponse({
         "kpis": {
             "appointments_booked_month": booked_month,
             "handoffs_requiring_action": handoffs,
@@ -245,38 +264,57 @@ async def dashboard_stats() -> Dict[str, Any]:
             },
             "appointments_trend": appt_series,
         },
-    }
+    })
 
 
-@router.get("/campaigns")
+@router.get("/campaigns", response_class=MongoJSONResponse)
 async def list_campaigns(
     status: str | None = None,
     page: int = Query(1, ge=1),
     limit: int = Query(25, ge=1, le=100),
-) -> Dict[str, Any]:
-    db = await get_database()
-    repo = BaseRepository(db)
+    repo: BaseRepository = Depends(get_repo),
+) -> MongoJSONResponse:
     query: Dict[str, Any] = {}
     if status:
         query["status"] = status
 
-    items: List[Dict[str, Any]] = await repo.find_many("campaigns", query, sort=[("updated_at", -1)])
-    total = len(items)
+    total = await repo.count_many("campaigns", query)
     start = (page - 1) * limit
-    end = start + limit
-    page_items = items[start:end]
+
+    # Page server-side and join patient names in the same round trip (no per-row find_one)
+    pipeline: List[Dict[str, Any]] = [{"$match": query}, {"$sort": {"updated_at": -1}}]
+    if start:
+        pipeline.append({"$skip": start})
+    pipeline += [
+        {"$limit": limit},
+        {
+            "$lookup": {
+                "from": "patients",
+                "let": {"pid": "$patient_id"},
+                "pipeline": [
+                    # Support both ObjectId and string stored ids (from seed or legacy)
+                    {
+                        "$match": {
+                            "$expr": {
+                                "$eq": [
+                                    "$_id",
+                                    {"$convert": {"input": "$$pid", "to": "objectId", "onError": "$$pid", "onNull": None}},
+                                ]
+                            }
+                        }
+                    },
+                    {"$project": {"name": 1}},
+                    {"$limit": 1},
+                ],
+                "as": "patient",
+            }
+        },
+    ]
+    page_items = await repo.aggregate("campaigns", pipeline)
 
     results: List[Dict[str, Any]] = []
     for c in page_items:
-        pid = c.get("patient_id")
-        # Support both ObjectId and string stored ids (from seed or legacy)
-        query_id = pid
-        if isinstance(pid, str):
-            try:
-                query_id = ObjectId(pid)
-            except Exception:
-                query_id = pid
-        patient = await repo.find_one("patients", {"_id": query_id})
+        patient = (c.get("patient") or [None])[0]
         results.append(
             {
                 "campaign_id": str(c.get("_id")),
@@ -287,20 +325,18 @@ async def list_campaigns(
             }
         )
 
-    return {
+    return MongoJSONResponse({
         "pagination": {
             "total_items": total,
             "total_pages": ceil(total / limit) if limit else 1,
             "current_page": page,
         },
         "campaigns": results,
-    }
+    })
 
 
-@router.get("/campaigns/{campaign_id}")
-async def campaign_details(campaign_id: str) -> Dict[str, Any]:
-    db = await get_database()
-    repo = BaseRepository(db)
+@router.get("/campaigns/{campaign_id}", response_class=MongoJSONResponse)
+async def campaign_details(campaign_id: str, repo: BaseRepository = Depends(get_repo)) -> MongoJSONResponse:
     try:
         oid = ObjectId(campaign_id)
     except Exception:
@@ -310,7 +346,11 @@ async def campaign_details(campaign_id: str) -> Dict[str, Any]:
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
 
-    messages = await repo.find_many("interactions", {"campaign_id": oid})
+    messages = await repo.find_many(
+        "interactions",
+        {"campaign_id": oid},
+        projection={"_id": 0, "direction": 1, "content": 1, "timestamp": 1},
+    )
     history = [
         {
             "direction": m.get("direction"),
@@ -328,7 +368,7 @@ async def campaign_details(campaign_id: str) -> Dict[str, Any]:
             pid_query = ObjectId(pid)
         except Exception:
             pid_query = pid
-    patient = await repo.find_one("patients", {"_id": pid_query})
+    patient = await repo.find_one("patients", {"_id": pid_query}, projection={"name": 1, "phone": 1, "email": 1})
 
     details = {
         "campaign_id": str(campaign.get("_id")),
@@ -339,17 +379,16 @@ async def campaign_details(campaign_id: str) -> Dict[str, Any]:
         "source": (campaign.get("channel") or {}).get("type") if isinstance(campaign.get("channel"), dict) else None,
         "engagement_summary": campaign.get("engagement_summary"),
     }
-    return {"campaign_details": details, "conversation_history": history}
+    return MongoJSONResponse({"campaign_details": details, "conversation_history": history})
 
 
-@router.get("/appointments")
+@router.get("/appointments", response_class=MongoJSONResponse)
 async def list_appointments(
     start_date: str | None = None,
     end_date: str | None = None,
     provider_id: str | None = None,  # Placeholder: provider not modeled yet
-) -> Dict[str, Any]:
-    db = await get_database()
-    repo = BaseRepository(db)
+    repo: BaseRepository = Depends(get_repo),
+) -> MongoJSONResponse:
     def _parse_iso(dt_str: str | None) -> datetime | None:
         if not dt_str:
             return None
@@ -378,7 +417,20 @@ async def list_appointments(
         }
 
     results: List[Dict[str, Any]] = []
-    for appt in await repo.find_many("appointments", appt_query):
+    # Join each appointment's patient in the same round trip instead of one find_one per row
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": appt_query},
+        {
+            "$lookup": {
+                "from": "patients",
+                "localField": "patient_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"name": 1, "email": 1, "phone": 1}}],
+                "as": "patient",
+            }
+        },
+    ]
+    for appt in await repo.aggregate("appointments", pipeline):
         ts = appt.get("appointment_date")
         if isinstance(ts, str):
             try:
@@ -393,7 +445,7 @@ async def list_appointments(
         if end_dt and (not ts or ts > end_dt):
             continue
 
-        patient = await repo.find_one("patients", {"_id": appt.get("patient_id")})
+        patient = (appt.get("patient") or [None])[0]
         results.append(
             {
                 "appointment_id": str(appt.get("_id", "")),
@@ -407,16 +459,14 @@ async def list_appointments(
             }
         )
 
-    return {"appointments": results}
+    return MongoJSONResponse({"appointments": results})
 
 
 # Milestone 6: Write operations
 
 
 @router.post("/campaigns/recovery")
-async def create_recovery_campaign(payload: RecoveryCampaignCreate) -> Dict[str, str]:
-    db = await get_database()
-    repo = BaseRepository(db)
+async def create_recovery_campaign(payload: RecoveryCampaignCreate, repo: BaseRepository = Depends(get_repo)) -> Dict[str, str]:
     # Create patient using model to ensure full document shape
     patient_model = Patient(
         name=payload.patient_name,
@@ -425,7 +475,20 @@ async def create_recovery_campaign(payload: RecoveryCampaignCreate) -> Dict[str,
         patient_type=PatientType.COLD_LEAD,
         preferred_channel=[ChannelType.email],
     )
-    presult_id = await repo.insert_one("patients", patient_model.model_dump(by_alias=True, exclude_none=False))
+    # Reuse an existing patient with this email (case-insensitive, index-backed) instead of
+    # tripping the unique patients.email index with a second insert
+    email_query = {"email": str(payload.patient_email)}
+    patient = await repo.find_one("patients", email_query, projection={"_id": 1}, collation=EMAIL_COLLATION)
+    if patient is not None:
+        presult_id = patient["_id"]
+    else:
+        try:
+            presult_id = await repo.insert_one("patients", patient_model.model_dump(by_alias=True, exclude_none=False))
+        except DuplicateKeyError:
+            patient = await repo.find_one("patients", email_query, projection={"_id": 1}, collation=EMAIL_COLLATION)
+            if patient is None:
+                raise
+            presult_id = patient["_id"]
 
     # Create campaign via model
     campaign_model = Campaign(
@@ -439,9 +502,7 @@ async def create_recovery_campaign(payload: RecoveryCampaignCreate) -> Dict[str,
 
 
 @router.post("/campaigns/{campaign_id}/respond")
-async def respond_to_campaign(campaign_id: str, payload: CampaignRespondRequest) -> Dict[str, str]:
-    db = await get_database()
-    repo = BaseRepository(db)
+async def respond_to_campaign(campaign_id: str, payload: CampaignRespondRequest, repo: BaseRepository = Depends(get_repo)) -> Dict[str, str]:
     try:
         oid = ObjectId(campaign_id)
     except Exception:
@@ -449,38 +510,56 @@ async def respond_to_campaign(campaign_id: str, payload: CampaignRespondRequest)
 
     # Create outgoing interaction via model
     interaction = Interaction(campaign_id=oid, direction=Direction.outgoing, content=payload.message)
-    await repo.insert_one("interactions", interaction.model_dump(by_alias=True, exclude_none=False))
-
-    # Update campaign status
-    await repo.update_one("campaigns", {"_id": oid}, {"$set": {"status": payload.new_status}})
+    # Interaction insert and campaign status update are independent; run them concurrently
+    await asyncio.gather(
+        repo.insert_one("interactions", interaction.model_dump(by_alias=True, exclude_none=False)),
+        repo.update_one("campaigns", {"_id": oid}, {"$set": {"status": payload.new_status}}),
+    )
     return {"message": "Response sent successfully."}
 
 
 @router.post("/appointments")
-async def create_admin_appointment(payload: AdminAppointmentCreate) -> Dict[str, Any]:
-    db = await get_database()
-    repo = BaseRepository(db)
+async def create_admin_appointment(payload: AdminAppointmentCreate, repo: BaseRepository = Depends(get_repo)) -> Dict[str, Any]:
     logger.info("appointments.create.request", extra={"email": str(payload.email), "date": str(payload.appointment_date)})
     try:
-        patient = await repo.find_one("patients", {"email": str(payload.email)})
-        new_patient_created = False
-        if not patient:
-            # create patient with full model
-            preferred = [ChannelType.email]
-            if payload.preferred_channel and payload.preferred_channel in {c.value for c in ChannelType}:  # type: ignore[attr-defined]
-                try:
-                    preferred = [ChannelType(payload.preferred_channel)]
-                except Exception:
-                    preferred = [ChannelType.email]
-            patient_model = Patient(
-                name=payload.name,
-                email=str(payload.email),
-                phone=payload.phone or "",
-                patient_type=PatientType.EXISTING,
-                preferred_channel=preferred,
+        # Build the full patient document up front so lookup-or-create is a single round trip
+        preferred = [ChannelType.email]
+        if payload.preferred_channel and payload.preferred_channel in {c.value for c in ChannelType}:  # type: ignore[attr-defined]
+            try:
+                preferred = [ChannelType(payload.preferred_channel)]
+            except Exception:
+                preferred = [ChannelType.email]
+        patient_model = Patient(
+            name=payload.name,
+            email=str(payload.email),
+            phone=payload.phone or "",
+            patient_type=PatientType.EXISTING,
+            preferred_channel=preferred,
+        )
+        now = utcnow()
+        new_patient_doc = patient_model.model_dump(by_alias=True, exclude_none=False)
+        new_patient_doc.pop("email", None)
+        new_patient_doc.update({"_id": ObjectId(), "created_at": now, "updated_at": now})
+        # Returns the pre-existing document, or None when the upsert inserted a new patient
+        try:
+            patient = await repo.find_one_and_update(
+                "patients",
+                {"email": str(payload.email)},
+                {"$setOnInsert": new_patient_doc},
+                upsert=True,
+                projection={"_id": 1, "phone": 1},
+                collation=EMAIL_COLLATION,
+            )
+        except DuplicateKeyError:
+            # A concurrent create won the unique-email race; use the patient it inserted
+            patient = await repo.find_one(
+                "patients", {"email": str(payload.email)}, projection={"_id": 1, "phone": 1}, collation=EMAIL_COLLATION
             )
-            patient_id = await repo.insert_one("patients", patient_model.model_dump(by_alias=True, exclude_none=False))
-            new_patient_created = True
+            if patient is None:
+                raise
+        new_patient_created = patient is None
+        if new_patient_created:
+            patient_id = new_patient_doc["_id"]
         else:
             patient_id = patient["_id"]
             # Upsert phone if missing and payload provides one
@@ -502,7 +581,9 @@ async def create_admin_appointment(payload: AdminAppointmentCreate) -> Dict[str,
             patient_match = {"$or": [{"patient_id": patient_oid}, {"patient_id": patient_id}]}
         else:
             patient_match = {"patient_id": patient_id}
-        existing_list = await repo.find_many("campaigns", patient_match, sort=[("updated_at", -1)], limit=1)
+        existing_list = await repo.find_many(
+            "campaigns", patient_match, sort=[("updated_at", -1)], limit=1, projection={"_id": 1, "status": 1}
+        )
         existing_campaign = existing_list[0] if existing_list else None
 
         one_day_before = None
@@ -520,7 +601,7 @@ async def create_admin_appointment(payload: AdminAppointmentCreate) -> Dict[str,
                 try:
                     reminder = AppointmentReminderCampaignCreate(
                         patient_id=patient_oid,  # type: ignore[arg-type]
-                        campaign_type=CampaignType.APPOINTMENT_REMINDER if hasattr(CampaignType, 'APPOINTMENT_REMINDER') else CampaignType.RECALL,
+                        campaign_type=CampaignType.APPOINTMENT_REMINDER,
                         status=None,
                         channel=Channel(type="email", thread_id=None),  # default channel placeholder
                         engagement_summary=None,
@@ -538,7 +619,7 @@ async def create_admin_appointment(payload: AdminAppointmentCreate) -> Dict[str,
             # Include full schema fields (excluding autogenerated ones)
             return {
                 "patient_id": patient_id,
-                "campaign_type": (CampaignType.APPOINTMENT_REMINDER.value if hasattr(CampaignType, 'APPOINTMENT_REMINDER') else CampaignType.RECALL.value),
+                "campaign_type": CampaignType.APPOINTMENT_REMINDER.value,
                 "status": None,
                 "channel": {"type": "email", "thread_id": None},
                 "engagement_summary": None,
@@ -627,9 +708,7 @@ async def create_admin_appointment(payload: AdminAppointmentCreate) -> Dict[str,
 
 
 @router.post("/appointments/{appointment_id}/complete")
-async def complete_appointment(appointment_id: str, payload: CompleteAppointmentRequest) -> Dict[str, str]:
-    db = await get_database()
-    repo = BaseRepository(db)
+async def complete_appointment(appointment_id: str, payload: CompleteAppointmentRequest, repo: BaseRepository = Depends(get_repo)) -> Dict[str, str]:
     # Accept both ObjectId and string ids for tests/fakes
     oid = None
     try:
@@ -651,6 +730,9 @@ async def complete_appointment(appointment_id: str, payload: CompleteAppointment
     else:
         await repo.update_one("appointments", {"_id": appointment_id}, {"$set": {"status": AppointmentStatus.completed.value}})
 
+    # Steps 2 and 3 touch different documents; collect them and run concurrently
+    writes = []
+
     # Step 2: update campaign if exists
     campaign_id = appointment.get("campaign_id")
     if campaign_id:
@@ -667,11 +749,12 @@ async def complete_appointment(appointment_id: str, payload: CompleteAppointment
                     },
                 }
             )
-        await repo.update_one("campaigns", {"_id": campaign_id}, {"$set": updates})
+        writes.append(repo.update_one("campaigns", {"_id": campaign_id}, {"$set": updates}))
 
     # Step 3: update patient treatment_history and optional future recall
     patient_id = appointment.get("patient_id")
-    if patient_id:
+
+    async def update_patient_history() -> None:
         try:
             history_item = TreatmentHistoryItem(
                 appointment_id=appointment.get("_id"),  # type: ignore[arg-type]
@@ -695,13 +778,15 @@ async def complete_appointment(appointment_id: str, payload: CompleteAppointment
             # Best-effort; do not fail completion if history update fails
             logger.exception("patients.treatment_history.update_failed", extra={"appointment_id": str(appointment_id)})
 
+    if patient_id:
+        writes.append(update_patient_history())
+    await asyncio.gather(*writes)
+
     return {"message": "Appointment completed."}
 
 
 @router.delete("/appointments/{appointment_id}")
-async def delete_appointment(appointment_id: str) -> Dict[str, str]:
-    db = await get_database()
-    repo = BaseRepository(db)
+async def delete_appointment(appointment_id: str, repo: BaseRepository = Depends(get_repo)) -> Dict[str, str]:
     # Accept either ObjectId hex or raw string ids for robustness
     query: Dict[str, Any]
     try:
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
@@ -7,9 +8,9 @@ import logging
 from fastapi.security import OAuth2PasswordRequestForm
 
 from schemas.auth import Token, UserDisplay
-from core.config import settings
 from services.security import (
     create_access_token,
+    dummy_verify_password,
     get_current_user,
     get_user_by_email,
     verify_password,
@@ -22,42 +23,40 @@ logger = logging.getLogger(__name__)
 
 @router.post("/auth/login", response_model=Token)
 async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> Token:
-    # Request-level diagnostics
-    logger.info(
-        "auth.login_request",
-        extra={
-            "method": request.method,
-            "path": str(request.url.path),
-            "content_type": request.headers.get("content-type"),
-            "accept": request.headers.get("accept"),
-            "user_agent": request.headers.get("user-agent"),
-        },
-    )
-
     username = (form_data.username or "").strip()
-    logger.info(
-        "auth.login_attempt",
-        extra={
-            "email": username,
-            "grant_type": form_data.grant_type,
-            "scopes": ",".join(form_data.scopes) if getattr(form_data, "scopes", None) else "",
-            "client_id_present": bool(getattr(form_data, "client_id", None)),
-            "client_secret_present": bool(getattr(form_data, "client_secret", None)),
-        },
-    )
-    if settings.environment == "development":
-        # WARNING: logs raw password for debugging in dev only
-        logger.info(
-            "auth.login_form_payload",
-            extra={"email": username, "password": form_data.password, "password_length": len(form_data.password or "")},
+    # Request-level diagnostics (debug only; skipped entirely at INFO and above)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "auth.login_request",
+            extra={
+                "method": request.method,
+                "path": str(request.url.path),
+                "content_type": request.headers.get("content-type"),
+                "accept": request.headers.get("accept"),
+                "user_agent": request.headers.get("user-agent"),
+            },
+        )
+        logger.debug(
+            "auth.login_attempt",
+            extra={
+                "email": username,
+                "grant_type": form_data.grant_type,
+                "scopes": ",".join(form_data.scopes) if getattr(form_data, "scopes", None) else "",
+                "client_id_present": bool(getattr(form_data, "client_id", None)),
+                "client_secret_present": bool(getattr(form_data, "client_secret", None)),
+            },
         )
     user = await get_user_by_email(username)
-    logger.info("auth.user_lookup", extra={"email": username, "found": bool(user)})
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("auth.user_lookup", extra={"email": username, "found": bool(user)})
+    # bcrypt is CPU-bound (~100ms); run it in the default executor to keep the event loop free
+    loop = asyncio.get_running_loop()
     if not user:
+        await loop.run_in_executor(None, dummy_verify_password)
         logger.warning("auth.login_user_not_found", extra={"email": username})
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
 
-    pwd_ok = verify_password(form_data.password, user.hashed_password)
+    pwd_ok = await loop.run_in_executor(None, verify_password, form_data.password, user.hashed_password)
     if not pwd_ok:
         logger.warning("auth.login_invalid_password", extra={"email": username})
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
@@ -1,24 +1,48 @@
 from __future__ import annotations
-import requests
-from datetime import datetime, timezone, timedelta, time
+from collections import defaultdict
+from datetime import date as date_cls, datetime, timezone, timedelta, time
 import os
+from functools import lru_cache
 from zoneinfo import ZoneInfo
-from dotenv import load_dotenv, find_dotenv
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
-from db.database import get_database
+from db.database import EMAIL_COLLATION, get_repo
 from core.config import settings
 from repositories.base import BaseRepository
 from models.appointment import Appointment, AppointmentStatus, CreatedFrom
 from models.campaign import CampaignStatus
 from schemas.public import AppointmentBookingRequest, AppointmentBookingResponse
+from services.http_client import DEFAULT_TIMEOUT, get_http_session
 
 
 router = APIRouter(tags=["public"])
 
-load_dotenv(find_dotenv(), override=True)
+@lru_cache(maxsize=8)
+def _tz(name: str) -> ZoneInfo:
+    # ZoneInfo construction parses tzdata; cache per name (falls back to UTC)
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return ZoneInfo("UTC")
+
+
+@lru_cache(maxsize=1)
+def _clinic_tz() -> ZoneInfo:
+    # Clinic timezone from TZ, resolved once per process
+    return _tz(os.getenv("TZ", "UTC"))
+
+
+# Slot computation only reads start time and length; skip the rest of each appointment doc
+_SLOT_PROJECTION = {"_id": 0, "appointment_date": 1, "duration_minutes": 1}
+
+# Base half-hour schedule 09:00–20:30, built once at import as (label, offset from local midnight)
+_SLOT_OFFSETS = tuple(
+    (f"{hour:02d}:{minute:02d}", timedelta(hours=hour, minutes=minute)) for hour in range(9, 21) for minute in (0, 30)
+)
+_BASE_SLOTS = frozenset(label for label, _ in _SLOT_OFFSETS)
 
 
 @router.get("/availability")
@@ -26,28 +50,14 @@ async def get_availability(
     month: int = Query(..., ge=1, le=12),
     year: int = Query(..., ge=2000),
     date: str | None = None,
+    repo: BaseRepository = Depends(get_repo),
 ) -> dict[str, list[str]]:
     # Generated schedule: Sun–Sat, 09:00–20:30 every 30 minutes.
     # Removes any slots already booked in the appointments collection.
     from calendar import monthrange
 
-    db = await get_database()
-    repo = BaseRepository(db)
-
     # Resolve clinic timezone for slot calculation (defaults to UTC)
-    tz_name = os.getenv("TZ", "UTC")
-    try:
-        clinic_tz = ZoneInfo(tz_name)
-    except Exception:
-        clinic_tz = ZoneInfo("UTC")
-
-    # Helper to generate base half-hour slots 09:00–20:30
-    def _generate_base_slots() -> list[str]:
-        base: list[str] = []
-        for hour in range(9, 21):  # 9 to 20 inclusive => 20:30 last half-hour
-            for minute in (0, 30):
-                base.append(f"{hour:02d}:{minute:02d}")
-        return base
+    clinic_tz = _clinic_tz()
 
     # Remove all half-hour slots that overlap with [start_local, start_local+duration)
     def _remove_occupied(
@@ -60,22 +70,13 @@ async def get_availability(
             dur = 45
         if dur <= 0:
             dur = 45
-        end_local = start_local + timedelta(minutes=dur)
-        tzinfo = start_local.tzinfo
-        # Iterate over existing labels and drop those that fall within the occupied interval
-        labels = list(available)
-        for label in labels:
-            try:
-                hh, mm = label.split(":")
-                slot_dt = datetime(day_local.year, day_local.month, day_local.day, int(hh), int(mm))
-                if tzinfo is not None:
-                    slot_dt = slot_dt.replace(tzinfo=tzinfo)
-                # Start-inclusive, end-exclusive
-                if start_local <= slot_dt < end_local:
-                    available.discard(label)
-            except Exception:
-                # Ignore malformed labels
-                continue
+        # Compare wall-clock offsets from the local midnight instead of building a datetime per label
+        start_off = start_local.replace(tzinfo=None) - datetime.combine(day_local, time.min)
+        end_off = start_off + timedelta(minutes=dur)
+        for label, off in _SLOT_OFFSETS:
+            # Start-inclusive, end-exclusive
+            if start_off <= off < end_off:
+                available.discard(label)
 
     # If a specific date is provided (YYYY-MM-DD), return availability for that date only
     if date:
@@ -85,8 +86,7 @@ async def get_availability(
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-        base_slots = _generate_base_slots()
-        available = set(base_slots)
+        available = set(_BASE_SLOTS)
 
         # Compute local day start/end and convert to UTC naive for range query (works with typical Mongo UTC-naive storage)
         start_local = datetime.combine(target_dt, time.min, tzinfo=clinic_tz)
@@ -96,7 +96,7 @@ async def get_availability(
         day_filter = {"appointment_date": {"$gte": start_utc, "$lte": end_utc}}
 
         # Fetch only relevant appointments (date + optional service)
-        day_appts = await repo.find_many("appointments", day_filter)
+        day_appts = await repo.find_many("appointments", day_filter, projection=_SLOT_PROJECTION)
         for a in day_appts:
             ts = a.get("appointment_date")
             if isinstance(ts, datetime):
@@ -110,7 +110,6 @@ async def get_availability(
         return {target_dt.isoformat(): sorted(available)}
 
     num_days = monthrange(year, month)[1]
-    base_slots: list[str] = _generate_base_slots()
 
     slots_by_date: dict[str, list[str]] = {}
     # Pre-fetch appointments for the month (range + optional service)
@@ -119,23 +118,28 @@ async def get_availability(
     start_of_month_utc = start_of_month_local.astimezone(timezone.utc).replace(tzinfo=None)
     end_of_month_utc = end_of_month_local.astimezone(timezone.utc).replace(tzinfo=None)
     month_filter = {"appointment_date": {"$gte": start_of_month_utc, "$lte": end_of_month_utc}}
-    month_appts = await repo.find_many("appointments", month_filter)
+    month_appts = await repo.find_many("appointments", month_filter, projection=_SLOT_PROJECTION)
+
+    # Group appointments by local date once so each day only visits its own bookings
+    by_date: dict[date_cls, list[tuple[datetime, int]]] = defaultdict(list)
+    for a in month_appts:
+        ts = a.get("appointment_date")
+        if isinstance(ts, datetime):
+            # Normalize to UTC if naive, then convert to local time before comparing to generated local schedule
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            local_ts = ts.astimezone(clinic_tz)
+            by_date[local_ts.date()].append((local_ts, a.get("duration_minutes", 45)))
+
     for day in range(1, num_days + 1):
         dt = datetime(year, month, day)
         # Allow all days
         date_str = dt.date().isoformat()
-        available = set(base_slots)
+        available = set(_BASE_SLOTS)
 
-        # Remove booked appointment slots for this date by parsing stored values
-        for a in month_appts:
-            ts = a.get("appointment_date")
-            if isinstance(ts, datetime):
-                # Normalize to UTC if naive, then convert to local time before comparing to generated local schedule
-                if ts.tzinfo is None:
-                    ts = ts.replace(tzinfo=timezone.utc)
-                local_ts = ts.astimezone(clinic_tz)
-                if local_ts.date() == dt.date():
-                    _remove_occupied(available, day_local=dt.date(), start_local=local_ts, duration_minutes=a.get("duration_minutes", 45))
+        # Remove booked appointment slots for this date
+        for start_local, dur in by_date.get(dt.date(), ()):
+            _remove_occupied(available, day_local=dt.date(), start_local=start_local, duration_minutes=dur)
 
         slots_by_date[date_str] = sorted(available)
 
@@ -179,7 +183,10 @@ async def phone_booking_post(number: str, name: str):
     }
     # Send POST request
     try:
-        response = requests.post(url, data=data, auth=(account_sid, auth_token))
+        # requests is blocking; keep the Twilio round trip off the event loop
+        response = await run_in_threadpool(
+            get_http_session().post, url, data=data, auth=(account_sid, auth_token), timeout=DEFAULT_TIMEOUT
+        )
         return {"message": "Message sent successfully"}, 200
     except Exception as e:
         return {"message": f"Error sending message: {str(e)}"}, 400
@@ -187,12 +194,12 @@ async def phone_booking_post(number: str, name: str):
 
 
 @router.post("/appointments/book", response_model=AppointmentBookingResponse)
-async def book_appointment(payload: AppointmentBookingRequest) -> AppointmentBookingResponse:
-    db = await get_database()
-    repo = BaseRepository(db)
-
+async def book_appointment(payload: AppointmentBookingRequest, repo: BaseRepository = Depends(get_repo)) -> AppointmentBookingResponse:
     # Step 1: Identify the patient strictly by email (per requirement)
-    patient = await repo.find_one("patients", {"email": payload.email})
+    # EMAIL_COLLATION matches the unique patients.email index, so this is an index lookup
+    patient = await repo.find_one(
+        "patients", {"email": payload.email}, projection={"_id": 1}, collation=EMAIL_COLLATION
+    )
     if not patient:
         # Return a generic message suitable for public UX
         raise HTTPException(status_code=404, detail="User not found")
@@ -210,6 +217,7 @@ async def book_appointment(payload: AppointmentBookingRequest) -> AppointmentBoo
         },
         sort=[("updated_at", -1)],
         limit=1,
+        projection={"_id": 1},
     )
     campaign = campaigns[0] if campaigns else None
     if not campaign:
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from enum import Enum
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+
+
+def _orjson_default(value: Any) -> Any:
+    # orjson handles dict/list/str/datetime natively; only Mongo/Pydantic leftovers reach here
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError
+
+
+class MongoJSONResponse(ORJSONResponse):
+    # Returned directly from endpoints so FastAPI skips its recursive jsonable_encoder pass
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
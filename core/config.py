@@ -3,14 +3,10 @@ from __future__ import annotations
 from functools import lru_cache
 from typing import Literal
 
-from dotenv import load_dotenv
 from pydantic import Field, AliasChoices
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
-load_dotenv()
-
-
 class AppSettings(BaseSettings):
     # Pydantic v2 settings configuration
     model_config = SettingsConfigDict(
@@ -42,6 +38,34 @@ class AppSettings(BaseSettings):
     twilio_auth_token: str | None = Field(default=None, alias="TWILIO_AUTH_TOKEN")
     twilio_phone_number: str | None = Field(default=None, alias="TWILIO_PHONE_NUMBER")
 
+    # Email reply agent
+    mongodb_campaign_collection: str = Field(default="campaigns", alias="MONGODB_CAMPAIGN_COLLECTION")
+    openai_api_key: str | None = Field(default=None, alias="OPENAI_API_KEY")
+    email_from_address: str = Field(default="noreply@clinic.example.com", alias="EMAIL_FROM_ADDRESS")
+
+    # Gmail / PubSub integration
+    google_client_secrets_file: str = Field(default="confidential.json", alias="GOOGLE_CLIENT_SECRETS_FILE")
+    google_token_file: str = Field(default="token.json", alias="GOOGLE_TOKEN_FILE")
+    gmail_user_email: str | None = Field(default=None, alias="GMAIL_USER_EMAIL")
+    gmail_topic_name: str | None = Field(default=None, alias="GMAIL_TOPIC_NAME")  # projects/<project>/topics/<topic>
+    gmail_label_ids_default: str = Field(default="INBOX", alias="GMAIL_LABEL_IDS")
+    gmail_label_filter_action_default: str = Field(default="include", alias="GMAIL_LABEL_FILTER_ACTION")
+    gmail_process_replies_only: bool = Field(default=False, alias="GMAIL_PROCESS_REPLIES_ONLY")
+
+    pubsub_verification_token: str | None = Field(default=None, alias="PUBSUB_VERIFICATION_TOKEN")
+    pubsub_oidc_audience: str | None = Field(default=None, alias="PUBSUB_OIDC_AUDIENCE")
+
+    # /pubsub/push acks immediately; this many workers drain the in-memory queue
+    pubsub_workers: int = Field(default=16, alias="PUBSUB_WORKERS")
+    pubsub_queue_size: int = Field(default=20000, alias="PUBSUB_QUEUE_SIZE")
+
+    # Concurrent /agent/* runs per worker, and how many may wait before callers get 429
+    llm_concurrency: int = Field(default=8, alias="LLM_CONCURRENCY")
+    llm_max_waiting: int = Field(default=32, alias="LLM_MAX_WAITING")
+
+    # Worker threads for blocking agent / Gmail calls offloaded from the event loop
+    threadpool_size: int = Field(default=64, alias="THREADPOOL_SIZE")
+
 
 @lru_cache(maxsize=1)
 def get_settings() -> AppSettings:
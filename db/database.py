@@ -1,23 +1,84 @@
 from __future__ import annotations
 
+import logging
 from functools import lru_cache
+from typing import Any
 
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
 
 from core.config import settings
+from repositories.base import BaseRepository
+
+
+logger = logging.getLogger(__name__)
+
+# Case-insensitive collation shared by the patients.email index and the queries that use it
+EMAIL_COLLATION = {"locale": "en", "strength": 2}
+
+# (collection, keys, options) for every index the hot query paths rely on
+INDEX_SPECS: list[tuple[str, list[tuple[str, int]], dict[str, Any]]] = [
+    ("patients", [("email", 1)], {"unique": True, "collation": EMAIL_COLLATION}),
+    ("roles", [("email", 1)], {"unique": True, "collation": EMAIL_COLLATION}),
+    ("campaigns", [("patient_id", 1), ("updated_at", -1)], {}),
+    ("campaigns", [("channel.thread_id", 1)], {}),
+    ("campaigns", [("status", 1), ("updated_at", -1)], {}),
+    ("campaigns", [("campaign_type", 1), ("status", 1)], {}),
+    ("interactions", [("campaign_id", 1), ("timestamp", 1)], {}),
+    ("appointments", [("appointment_date", 1)], {}),
+    ("appointments", [("patient_id", 1), ("appointment_date", 1)], {}),
+    ("appointments", [("campaign_id", 1)], {}),
+    ("gmail_processed", [("emailAddress", 1), ("gmailMessageId", 1)], {"unique": True}),
+    ("gmail_states", [("emailAddress", 1)], {"unique": True}),
+    ("kb_answers", [("created_at", 1)], {"expireAfterSeconds": 30 * 24 * 60 * 60}),
+]
 
 
 @lru_cache(maxsize=1)
-def get_motor_client() -> AsyncIOMotorClient:
-    return AsyncIOMotorClient(settings.mongo_uri)
+def get_mongo_client() -> AsyncMongoClient:
+    # One pooled client per process, natively asyncio (no Motor executor hop per operation);
+    # wire compression: zstd (via `zstandard`) when the server supports it, zlib otherwise
+    return AsyncMongoClient(
+        settings.mongo_uri,
+        maxPoolSize=100,
+        minPoolSize=10,
+        compressors="zstd,zlib",
+        zlibCompressionLevel=6,
+    )
 
 
-async def get_database() -> AsyncIOMotorDatabase:
-    client = get_motor_client()
+async def get_database() -> AsyncDatabase:
+    client = get_mongo_client()
     return client[settings.database_name]
 
 
+@lru_cache(maxsize=1)
+def _repo_singleton() -> BaseRepository:
+    return BaseRepository(get_mongo_client()[settings.database_name])
+
+
+async def get_repo() -> BaseRepository:
+    # FastAPI dependency: one shared repository per process instead of per request
+    return _repo_singleton()
+
+
+async def close_mongo_client() -> None:
+    if get_mongo_client.cache_info().currsize:
+        await get_mongo_client().close()
+        get_mongo_client.cache_clear()
+        _repo_singleton.cache_clear()
+
+
+async def ensure_indexes() -> None:
+    # Idempotent; a failure (e.g. duplicate emails blocking a unique index) is logged, not fatal
+    db = await get_database()
+    for collection, keys, options in INDEX_SPECS:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception:
+            logger.exception("db.ensure_index_failed", extra={"collection": collection, "keys": str(keys)})
+
+
 async def close_database() -> None:
-    client = get_motor_client()
-    client.close()
+    await close_mongo_client()
 
@@ -1,64 +1,136 @@
 from __future__ import annotations
 
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
 from datetime import datetime, timezone, timedelta
 from bson import ObjectId
-from pymongo import MongoClient, DESCENDING
-from .config import settings
-from dotenv import load_dotenv
+import threading
+from functools import lru_cache
 
-load_dotenv()
+from cachetools import TTLCache
+from pymongo import MongoClient, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+from core.config import settings
+from db.database import EMAIL_COLLATION
 
 _client: Optional[MongoClient] = None
 
+# historyId checkpoints are $max-guarded and a lost one only replays history that the processed-message
+# markers dedupe, so they skip the journal/replication wait; every other write keeps the default
+_CHECKPOINT_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Process-local memo of Gmail message ids already claimed; only positives are cached so a
+# message claimed by another worker is still resolved through MongoDB
+_processed_cache: TTLCache = TTLCache(maxsize=50_000, ttl=24 * 60 * 60)
+_processed_cache_lock = threading.Lock()
+
+# Latest Gmail historyId per mailbox awaiting a batched write to gmail_states
+_pending_history_ids: dict[str, int] = {}
+_pending_history_lock = threading.Lock()
+
 
 def get_mongo_client() -> MongoClient:
     global _client
     if _client is None:
-        _client = MongoClient(settings.mongodb_uri)
+        _client = MongoClient(
+            settings.mongo_uri,
+            appname="email-reply-agent",
+            # Reply workflows run on threadpool workers; give each one a connection instead of queueing
+            maxPoolSize=max(50, settings.threadpool_size),
+            minPoolSize=5,
+            maxIdleTimeMS=300_000,
+            retryWrites=True,
+            compressors="zstd,zlib",
+            zlibCompressionLevel=6,
+        )
     return _client
 
 
+# Database/collection handles are memoized: building them walks client attributes and, for
+# with_options(), allocates a new Collection on every call
+@lru_cache(maxsize=1)
 def get_db():
     client = get_mongo_client()
-    return client[settings.mongodb_db_name]
+    return client[settings.database_name]
 
 
+@lru_cache(maxsize=1)
 def get_campaign_collection():
     return get_db()[settings.mongodb_campaign_collection]
 
 
+@lru_cache(maxsize=1)
 def get_interaction_collection():
     return get_db()["interactions"]
 
 
+@lru_cache(maxsize=1)
 def get_gmail_state_collection():
-    return get_db()["gmail_states"]
+    return get_db()["gmail_states"].with_options(write_concern=_CHECKPOINT_WRITE_CONCERN)
 
 
+@lru_cache(maxsize=1)
 def get_gmail_processed_collection():
     return get_db()["gmail_processed"]
 
 
+@lru_cache(maxsize=1)
 def get_patient_collection():
     return get_db()["patients"]
 
 
+@lru_cache(maxsize=1)
+def get_kb_answer_collection():
+    return get_db()["kb_answers"]
+
+
 # Lookups
 
-def find_patient_by_email(email: str) -> Optional[dict[str, Any]]:
+# The reply workflow only reads these patient/campaign fields (projected inside the $lookup aggregation)
+_PATIENT_PROJECTION = {"_id": 1, "name": 1, "email": 1}
+_CAMPAIGN_PROJECTION = {
+    "_id": 1,
+    "campaign_type": 1,
+    "channel": 1,
+    "patient": 1,
+    "patient_name": 1,
+    "patient_email": 1,
+    "email": 1,
+    "engagement_summary": 1,
+    "last_summary_at": 1,
+}
+
+
+def find_patient_with_latest_campaign(email: str) -> tuple[Optional[dict[str, Any]], Optional[dict[str, Any]]]:
     if not email:
-        return None
+        return None, None
     coll = get_patient_collection()
-    patient = coll.find_one({"email": {"$regex": f"^{email}$", "$options": "i"}})
-    return patient
-
-
-def find_latest_campaign_by_patient_id(patient_id: ObjectId) -> Optional[dict[str, Any]]:
-    coll = get_campaign_collection()
-    # Prefer most recently updated
-    campaign = coll.find_one({"patient_id": patient_id}, sort=[("updated_at", DESCENDING)])
-    return campaign
+    # One round trip: patient by email plus its most recently updated campaign
+    pipeline = [
+        {"$match": {"email": email.strip().lower()}},
+        {"$limit": 1},
+        {"$project": _PATIENT_PROJECTION},
+        {
+            "$lookup": {
+                "from": settings.mongodb_campaign_collection,
+                "let": {"pid": "$_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$patient_id", "$$pid"]}}},
+                    {"$sort": {"updated_at": DESCENDING}},
+                    {"$limit": 1},
+                    {"$project": _CAMPAIGN_PROJECTION},
+                ],
+                "as": "latest_campaign",
+            }
+        },
+        {"$unwind": {"path": "$latest_campaign", "preserveNullAndEmptyArrays": True}},
+    ]
+    docs = list(coll.aggregate(pipeline, collation=EMAIL_COLLATION))
+    if not docs:
+        return None, None
+    patient = docs[0]
+    campaign = patient.pop("latest_campaign", None)
+    return patient, campaign
 
 
 def find_campaign_by_thread_id(thread_id: str) -> Optional[dict[str, Any]]:
@@ -69,62 +141,51 @@ def find_campaign_by_thread_id(thread_id: str) -> Optional[dict[str, Any]]:
 
 # Updates
 
-def ensure_campaign_thread_id(campaign_id: ObjectId, thread_id: Optional[str]) -> None:
-    if not thread_id:
-        return
-    coll = get_campaign_collection()
-    coll.update_one(
-        {"_id": campaign_id},
-        {"$set": {"channel.thread_id": thread_id, "updated_at": datetime.now(timezone.utc)}},
-    )
+def campaign_form_sent_fields(link_url: str, reply_thread_id: str, now: datetime) -> dict[str, Any]:
+    return {
+        "status": "BOOKING_INITIATED",
+        "follow_up_details.next_attempt_at": now + timedelta(days=1),
+        "follow_up_details.attempts_made": 1,
+        "booking_funnel.status": "FORM_SENT",
+        "booking_funnel.link_url": link_url,
+        "channel.thread_id": reply_thread_id,
+    }
 
 
-def set_campaign_form_sent(campaign_id: ObjectId, link_url: str, reply_thread_id: str) -> None:
+def update_campaign_fields(campaign_id: ObjectId, fields: dict[str, Any], now: Optional[datetime] = None) -> None:
     coll = get_campaign_collection()
-    now = datetime.now(timezone.utc)
     coll.update_one(
         {"_id": campaign_id},
-        {
-            "$set": {
-                "status": "BOOKING_INITIATED",
-                "follow_up_details.next_attempt_at": now + timedelta(days=1),
-                "follow_up_details.attempts_made": 1,
-                "booking_funnel.status": "FORM_SENT",
-                "booking_funnel.link_url": link_url,
-                "channel.thread_id": reply_thread_id,
-                "updated_at": now,
-            }
-        },
+        {"$set": {**fields, "updated_at": now or datetime.now(timezone.utc)}},
     )
 
 
-def set_campaign_declined(campaign_id: ObjectId) -> None:
+def set_campaign_declined(campaign_id: ObjectId, now: Optional[datetime] = None) -> None:
     coll = get_campaign_collection()
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     coll.update_one(
         {"_id": campaign_id},
         {"$set": {"status": "RECOVERY_DECLINED", "updated_at": now}},
     )
 
 
-def set_campaign_handoff_required(campaign_id: ObjectId) -> None:
+def set_campaign_handoff_required(campaign_id: ObjectId, now: Optional[datetime] = None) -> None:
     coll = get_campaign_collection()
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     coll.update_one(
         {"_id": campaign_id},
         {"$set": {"status": "HANDOFF_REQUIRED", "updated_at": now}},
     )
 
 
-def insert_interaction(
+def build_interaction(
     *,
     campaign_id: ObjectId,
     direction: str,
     content: str,
     intent: Optional[str] = None,
     sentiment: Optional[str] = None,
-) -> Any:
-    coll = get_interaction_collection()
+) -> dict[str, Any]:
     doc: dict[str, Any] = {
         "campaign_id": campaign_id,
         "direction": direction,
@@ -134,65 +195,163 @@ def insert_interaction(
     }
     if intent is not None or sentiment is not None:
         doc["ai_analysis"] = {k: v for k, v in {"intent": intent, "sentiment": sentiment}.items() if v is not None}
-    return coll.insert_one(doc)
+    return doc
+
 
+def insert_interactions(docs: list[dict[str, Any]]) -> None:
+    # One round trip for all interactions buffered during a workflow run
+    if docs:
+        get_interaction_collection().insert_many(docs, ordered=False)
 
-def fetch_interactions_for_campaign(campaign_id: ObjectId) -> list[dict[str, Any]]:
+
+def fetch_interactions_for_campaign(campaign_id: ObjectId, since: Optional[datetime] = None) -> Iterator[dict[str, Any]]:
     coll = get_interaction_collection()
-    return list(coll.find({"campaign_id": campaign_id}).sort("timestamp", 1))
+    query: dict[str, Any] = {"campaign_id": campaign_id}
+    if since is not None:
+        query["timestamp"] = {"$gt": since}
+    # Stream in batches so callers can format each message while the next batch is in flight;
+    # skip ai_analysis and other fields the summary never reads
+    return (
+        coll.find(query, {"_id": 0, "timestamp": 1, "direction": 1, "content": 1})
+        .sort("timestamp", 1)
+        .batch_size(200)
+    )
 
 
-def update_engagement_summary(campaign_id: ObjectId, summary: str) -> None:
-    coll = get_campaign_collection()
-    coll.update_one(
-        {"_id": campaign_id},
-        {"$set": {"engagement_summary": summary, "updated_at": datetime.now(timezone.utc)}},
+# Knowledge-base answer cache (documents expire via the kb_answers TTL index)
+
+def find_cached_kb_answer(key: str) -> Optional[str]:
+    doc = get_kb_answer_collection().find_one({"_id": key}, {"answer": 1})
+    return doc.get("answer") if doc else None
+
+
+def store_kb_answer(key: str, answer: str) -> None:
+    get_kb_answer_collection().update_one(
+        {"_id": key},
+        {"$set": {"answer": answer, "created_at": datetime.now(timezone.utc)}},
+        upsert=True,
     )
 
 
 # Gmail processing state
 
 def get_last_history_id(email_address: str) -> Optional[str]:
+    with _pending_history_lock:
+        pending = _pending_history_ids.get(email_address)
+    if pending is not None:
+        return str(pending)
     coll = get_gmail_state_collection()
-    doc = coll.find_one({"emailAddress": email_address})
-    return doc.get("historyId") if doc else None
+    doc = coll.find_one({"emailAddress": email_address}, {"historyId": 1})
+    history_id = doc.get("historyId") if doc else None
+    return str(history_id) if history_id is not None else None
+
+
+def _history_id_update(email_address: str, history_id: int, now: datetime) -> list[dict[str, Any]]:
+    # Pipeline update: keep the larger of stored/new historyId (legacy string values are coerced)
+    # so out-of-order notifications never move the checkpoint backwards
+    return [
+        {
+            "$set": {
+                "emailAddress": email_address,
+                "historyId": {
+                    "$max": [
+                        {"$convert": {"input": "$historyId", "to": "long", "onError": 0, "onNull": 0}},
+                        history_id,
+                    ]
+                },
+                "updated_at": now,
+            }
+        }
+    ]
 
 
 def set_last_history_id(email_address: str, history_id: str) -> None:
     coll = get_gmail_state_collection()
     coll.update_one(
         {"emailAddress": email_address},
-        {"$set": {"emailAddress": email_address, "historyId": history_id, "updated_at": datetime.now(timezone.utc)}},
+        _history_id_update(email_address, int(history_id), datetime.now(timezone.utc)),
         upsert=True,
     )
 
 
-def has_processed_message(email_address: str, gmail_message_id: str) -> bool:
-    coll = get_gmail_processed_collection()
-    doc = coll.find_one({"emailAddress": email_address, "gmailMessageId": gmail_message_id})
-    return doc is not None
+def queue_last_history_id(email_address: str, history_id: str) -> None:
+    # Coalesce checkpoint writes in memory; flush_pending_history_ids() persists them in one bulk_write
+    with _pending_history_lock:
+        current = _pending_history_ids.get(email_address)
+        _pending_history_ids[email_address] = max(int(history_id), current or 0)
 
 
-def mark_processed_message(email_address: str, gmail_message_id: str, thread_id: Optional[str] = None) -> None:
-    coll = get_gmail_processed_collection()
-    coll.update_one(
-        {"emailAddress": email_address, "gmailMessageId": gmail_message_id},
-        {
-            "$set": {
-                "emailAddress": email_address,
-                "gmailMessageId": gmail_message_id,
-                "threadId": thread_id,
-                "processed_at": datetime.now(timezone.utc),
-            }
-        },
-        upsert=True,
+def flush_pending_history_ids() -> int:
+    with _pending_history_lock:
+        pending = dict(_pending_history_ids)
+        _pending_history_ids.clear()
+    if not pending:
+        return 0
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne({"emailAddress": email}, _history_id_update(email, hid, now), upsert=True)
+        for email, hid in pending.items()
+    ]
+    try:
+        get_gmail_state_collection().bulk_write(ops, ordered=False)
+    except Exception:
+        # Re-queue so the next flush retries; $max makes the retry idempotent
+        with _pending_history_lock:
+            for email, hid in pending.items():
+                _pending_history_ids[email] = max(hid, _pending_history_ids.get(email) or 0)
+        raise
+    return len(ops)
+
+
+def claim_messages(email_address: str, messages: list[tuple[str, Optional[str]]]) -> list[str]:
+    # Atomic claim of a whole history page on the unique (emailAddress, gmailMessageId) index: one
+    # unordered insert_many, where duplicate-key failures are the ids someone already claimed.
+    # Returns claimed ids in input order
+    with _processed_cache_lock:
+        candidates = [(mid, tid) for mid, tid in messages if (email_address, mid) not in _processed_cache]
+    if not candidates:
+        return []
+    now = datetime.now(timezone.utc)
+    docs = [
+        {"emailAddress": email_address, "gmailMessageId": mid, "threadId": tid, "processed_at": now}
+        for mid, tid in candidates
+    ]
+    taken: set[int] = set()
+    try:
+        get_gmail_processed_collection().insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            # Unexpected failure: undo whatever did insert so nothing stays claimed unprocessed
+            failed = {err["index"] for err in errors}
+            inserted = [candidates[i][0] for i in range(len(candidates)) if i not in failed]
+            if inserted:
+                get_gmail_processed_collection().delete_many(
+                    {"emailAddress": email_address, "gmailMessageId": {"$in": inserted}}
+                )
+            raise
+        taken = {err["index"] for err in errors}
+    with _processed_cache_lock:
+        for mid, _ in candidates:
+            _processed_cache[(email_address, mid)] = True
+    return [mid for i, (mid, _) in enumerate(candidates) if i not in taken]
+
+
+def release_messages(email_address: str, gmail_message_ids: list[str]) -> None:
+    # Undo claims when processing failed so a redelivered notification can retry them: one delete_many
+    if not gmail_message_ids:
+        return
+    get_gmail_processed_collection().delete_many(
+        {"emailAddress": email_address, "gmailMessageId": {"$in": list(gmail_message_ids)}}
     )
+    with _processed_cache_lock:
+        for gmail_message_id in gmail_message_ids:
+            _processed_cache.pop((email_address, gmail_message_id), None)
 
 
-
-def set_campaign_re_engaged(campaign_id: ObjectId) -> None:
+def set_campaign_re_engaged(campaign_id: ObjectId, now: Optional[datetime] = None) -> None:
     coll = get_campaign_collection()
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     coll.update_one(
         {"_id": campaign_id},
         {"$set": {"status": "RE_ENGAGED", "updated_at": now, "follow_up_details.next_attempt_at": now + timedelta(days=3), "follow_up_details.attempts_made": 2}},
@@ -1,110 +1,110 @@
 from __future__ import annotations
 
-from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable, Dict, Any, Optional, Union
 
 from langgraph.graph import StateGraph, END
 
 from .state import ReplyState
-from .nodes import (
-    load_patient_and_campaign,
-    analyze_incoming,
-    record_incoming_interaction,
-    generate_booking_email,
-    generate_disambiguation_email,
-    generate_declined_email,
-    query_knowledge_base,
-    generate_answer_email,
-    update_campaign_for_handoff,
-    generate_handoff_email,
-    send_reply_email,
-    analyze_outgoing,
-    record_outgoing_interaction,
-    update_campaign_status,
-    update_campaign_to_declined,
-    ai_summary,
-    update_campaign_re_engaged
-)
 
 
-def build_graph():
-    graph = StateGraph(ReplyState)
+_BOOKABLE_CAMPAIGN_TYPES = frozenset({"RECOVERY", "RECALL"})
+
+# Intent -> next node; booking only proceeds for campaign types that have a booking funnel
+_INTENT_TO_NODE: Dict[str, Union[str, Callable[[Dict[str, Any]], str]]] = {
+    "booking_request": lambda state: "generate_booking_email" if _is_bookable(state) else "ai_summary",
+    "service_denial": "update_campaign_to_declined",
+    "irrelevant_confused": "generate_disambiguation_email",
+    "question": "query_knowledge_base",
+}
+
+_POST_OUTGOING_NODE: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "booking_request": lambda state: "update_campaign_status" if _is_bookable(state) else "ai_summary",
+}
+
+
+def _is_bookable(state: Dict[str, Any]) -> bool:
+    return (state.get("campaign") or {}).get("campaign_type") in _BOOKABLE_CAMPAIGN_TYPES
+
+
+def router(state: Dict[str, Any]) -> str:
+    target = _INTENT_TO_NODE.get(state.get("classified_intent"), "ai_summary")
+    return target(state) if callable(target) else target
+
+
+def answer_checker(state: Dict[str, Any]) -> str:
+    answer = (state.get("kb_answer") or "").strip()
+    if answer and answer != "NO_ANSWER":
+        return "update_campaign_re_engaged"
+    return "update_campaign_for_handoff"
 
-    graph.add_node("load_patient_and_campaign", load_patient_and_campaign)
-    graph.add_node("analyze_incoming", analyze_incoming)
-    graph.add_node("record_incoming_interaction", record_incoming_interaction)
-
-    graph.add_node("generate_booking_email", generate_booking_email)
-    graph.add_node("generate_disambiguation_email", generate_disambiguation_email)
-    graph.add_node("generate_declined_email", generate_declined_email)
-    graph.add_node("send_reply_email", send_reply_email)
-    graph.add_node("query_knowledge_base", query_knowledge_base)
-    graph.add_node("generate_answer_email", generate_answer_email)
-    graph.add_node("update_campaign_for_handoff", update_campaign_for_handoff)
-    graph.add_node("generate_handoff_email", generate_handoff_email)
-    graph.add_node("analyze_outgoing", analyze_outgoing)
-    graph.add_node("record_outgoing_interaction", record_outgoing_interaction)
-    graph.add_node("update_campaign_status", update_campaign_status)
-    graph.add_node("update_campaign_to_declined", update_campaign_to_declined)
-    graph.add_node("ai_summary", ai_summary)
-    graph.add_node("update_campaign_re_engaged", update_campaign_re_engaged)
-
-    graph.set_entry_point("load_patient_and_campaign")
-
-    graph.add_edge("load_patient_and_campaign", "analyze_incoming")
-    graph.add_edge("analyze_incoming", "record_incoming_interaction")
-
-    def router(state: Dict[str, Any]) -> str:
-        intent = state.get("classified_intent")
-        if intent == "booking_request":
-            campaign = state.get("campaign") or {}
-            campaign_type = campaign.get("campaign_type")
-            if campaign_type in {"RECOVERY", "RECALL"}:
-                return "generate_booking_email"
-        if intent == "service_denial":
-            return "update_campaign_to_declined"
-        if intent == "irrelevant_confused":
-            return "generate_disambiguation_email"
-        if intent == "question":
-            return "query_knowledge_base"
-        return "ai_summary"
-
-    graph.add_conditional_edges("record_incoming_interaction", router)
-
-    graph.add_edge("generate_booking_email", "send_reply_email")
-
-    graph.add_edge("generate_disambiguation_email", "send_reply_email")
-    graph.add_edge("update_campaign_to_declined", "generate_declined_email")
-    graph.add_edge("generate_declined_email", "send_reply_email")
+
+def post_outgoing_router(state: Dict[str, Any]) -> str:
+    target = _POST_OUTGOING_NODE.get(state.get("classified_intent"))
+    return target(state) if target else "ai_summary"
+
+
+_ENTRY_NODE = "load_patient_and_campaign"
+
+# Workflow topology, shared by the LangGraph build and the direct runner: each node maps to its
+# successor, either a fixed node name or a router returning one
+_EDGES: Dict[str, Union[str, Callable[[Dict[str, Any]], str]]] = {
+    "load_patient_and_campaign": "analyze_incoming",
+    "analyze_incoming": "record_incoming_interaction",
+    "record_incoming_interaction": router,
+    "generate_booking_email": "send_reply_email",
+    "generate_disambiguation_email": "send_reply_email",
+    "update_campaign_to_declined": "generate_declined_email",
+    "generate_declined_email": "send_reply_email",
     # Question branch routing
-    def answer_checker(state: Dict[str, Any]) -> str:
-        answer = (state.get("kb_answer") or "").strip()
-        if answer and answer != "NO_ANSWER":
-            return "update_campaign_re_engaged"
-        return "update_campaign_for_handoff"
-
-    graph.add_conditional_edges("query_knowledge_base", answer_checker)
-    graph.add_edge("update_campaign_re_engaged", "generate_answer_email")
-    graph.add_edge("generate_answer_email", "send_reply_email")
-    graph.add_edge("update_campaign_for_handoff", "generate_handoff_email")
-    graph.add_edge("generate_handoff_email", "send_reply_email")
-    graph.add_edge("send_reply_email", "analyze_outgoing")
-    graph.add_edge("analyze_outgoing", "record_outgoing_interaction")
+    "query_knowledge_base": answer_checker,
+    "update_campaign_re_engaged": "generate_answer_email",
+    "generate_answer_email": "send_reply_email",
+    "update_campaign_for_handoff": "generate_handoff_email",
+    "generate_handoff_email": "send_reply_email",
+    "send_reply_email": "analyze_outgoing",
+    "analyze_outgoing": "record_outgoing_interaction",
     # Post-outgoing routing: booking branch updates status then summary; others go to summary directly
-    def post_outgoing_router(state: Dict[str, Any]) -> str:
-        if state.get("classified_intent") == "booking_request":
-            campaign = state.get("campaign") or {}
-            if campaign.get("campaign_type") in {"RECOVERY", "RECALL"}:
-                return "update_campaign_status"
-        return "ai_summary"
+    "record_outgoing_interaction": post_outgoing_router,
+    "update_campaign_status": "ai_summary",
+    "ai_summary": END,
+}
+
 
-    graph.add_conditional_edges("record_outgoing_interaction", post_outgoing_router)
-    graph.add_edge("update_campaign_status", "ai_summary")
+@lru_cache(maxsize=1)
+def _node_table() -> Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]]:
+    # Deferred so importing this module (e.g. from the Gmail processor) doesn't pull in the LLM stack
+    from . import nodes
 
-    graph.add_edge("ai_summary", END)
+    return {name: getattr(nodes, name) for name in _EDGES}
 
+
+def build_graph():
+    graph = StateGraph(ReplyState)
+    for name, fn in _node_table().items():
+        graph.add_node(name, fn)
+    graph.set_entry_point(_ENTRY_NODE)
+    for name, successor in _EDGES.items():
+        if callable(successor):
+            graph.add_conditional_edges(name, successor)
+        else:
+            graph.add_edge(name, successor)
     return graph.compile()
 
 
+def _run_direct(state: Dict[str, Any]) -> Dict[str, Any]:
+    # Every path through the workflow is a straight line once the routers pick a branch, so walk
+    # the edge table directly instead of paying LangGraph's per-step channel bookkeeping
+    table = _node_table()
+    node = _ENTRY_NODE
+    while node != END:
+        state = table[node](state)
+        successor = _EDGES[node]
+        node = successor(state) if callable(successor) else successor
+    return state
+
+
 def run_reply_workflow(
     thread_id: str,
     reply_email_body: str,
@@ -115,10 +115,10 @@ def run_reply_workflow(
     inbound_subject: Optional[str] = None,
     inbound_references: Optional[str] = None,
 ) -> Dict[str, Any]:
-    app = build_graph()
     initial_state: ReplyState = {
         "thread_id": thread_id,
         "reply_email_body": reply_email_body,
+        "now": datetime.now(timezone.utc),
     }
     if patient_email:
         initial_state["patient_email"] = patient_email
@@ -130,5 +130,5 @@ def run_reply_workflow(
         initial_state["inbound_subject"] = inbound_subject
     if inbound_references:
         initial_state["inbound_references"] = inbound_references
-    result = app.invoke(initial_state)
+    result = _run_direct(dict(initial_state))
     return dict(result)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Optional
+
+from .prompts import KB_TEXT
+
+
+# Offline KB lookup used when no OpenAI key is configured: sections are indexed once at import
+# and scored by IDF-weighted term overlap with the question
+
+_SECTION_SPLIT_RE = re.compile(r"\n(?=\*\*\d+\. |- \*\*Q:)")
+_TOKEN_RE = re.compile(r"[a-zà-ÿ]+")
+_STOPWORDS = frozenset(
+    "the and for you your are can with that this what how when who does our its from have will about "
+    "into their them they it's is of to a in on or an be do".split()
+)
+
+
+def _tokenize(text: str) -> list[str]:
+    # Crude plural folding so "implants" matches "implant"
+    return [
+        t[:-1] if len(t) > 3 and t.endswith("s") else t
+        for t in _TOKEN_RE.findall(text.lower())
+        if len(t) > 2 and t not in _STOPWORDS
+    ]
+
+
+def _build_index() -> tuple[list[str], dict[str, list[int]]]:
+    sections = [
+        chunk.split("\n---")[0].replace("**", "").strip()
+        for chunk in _SECTION_SPLIT_RE.split(KB_TEXT)
+        if chunk.startswith("**") or chunk.startswith("- **Q:")
+    ]
+    index: dict[str, list[int]] = defaultdict(list)
+    for i, section in enumerate(sections):
+        for term in set(_tokenize(section)):
+            index[term].append(i)
+    return sections, dict(index)
+
+
+KB_SECTIONS, TERM_INDEX = _build_index()
+_IDF = {term: math.log(len(KB_SECTIONS) / len(ids)) for term, ids in TERM_INDEX.items()}
+
+
+def search_kb(question: str) -> Optional[str]:
+    scores: Counter[int] = Counter()
+    for term in set(_tokenize(question)):
+        weight = _IDF.get(term, 0.0)
+        if weight <= 0.0:
+            continue
+        for i in TERM_INDEX[term]:
+            scores[i] += weight
+    if not scores:
+        return None
+    best, _ = scores.most_common(1)[0]
+    return KB_SECTIONS[best]
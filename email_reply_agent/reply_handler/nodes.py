@@ -1,59 +1,101 @@
 from __future__ import annotations
 
-import uuid
-from typing import Any, Dict, Optional
+import hashlib
+import re
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Literal, Optional
 import logging
 
 from bson import ObjectId
+from cachetools import LRUCache
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
 
-from .config import settings
+from core.config import settings
 from .db import (
-    find_patient_by_email,
-    find_latest_campaign_by_patient_id,
-    ensure_campaign_thread_id,
-    set_campaign_form_sent,
+    find_patient_with_latest_campaign,
+    campaign_form_sent_fields,
     set_campaign_declined,
-    insert_interaction,
+    build_interaction,
+    insert_interactions,
     fetch_interactions_for_campaign,
-    update_engagement_summary,
+    find_cached_kb_answer,
+    store_kb_answer,
+    update_campaign_fields,
     set_campaign_re_engaged
 )
-from .prompts import INTENT_CLASSIFIER_PROMPT, ALLOWED_INTENTS
-from .prompts import KB_QA_PROMPT, KB_TEXT
+from .prompts import REPLY_ANALYSIS_PROMPT, SENTIMENT_PROMPT
+from .prompts import KB_SYSTEM_PROMPT
+from .kb_index import search_kb
 from .sender_gmail import send_gmail_message
 
 logger = logging.getLogger("email_reply_agent.reply_handler.nodes")
 
 
+@lru_cache(maxsize=1)
+def _get_llm() -> ChatOpenAI:
+    # One client per process so every node reuses its HTTP connection pool
+    return ChatOpenAI(model="gpt-4o-mini", temperature=0)
+
+
+# Cache keys include the KB prompt checksum so editing the KB or its rules invalidates stored answers
+_KB_HASH = hashlib.blake2b(KB_SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+
+# Process-local KB answers keyed by the normalized question, in front of the shared Mongo cache
+_kb_answer_memo: LRUCache = LRUCache(maxsize=1024)
+_kb_answer_memo_lock = threading.Lock()
+
+# Keyword fallback used when no OpenAI key is configured
+_BOOKING_RE = re.compile(r"\b(?:book|schedule|appointment|time slot)", re.IGNORECASE)
+_DENIAL_RE = re.compile(r"\b(?:no|not interested|stop|unsubscribe)\b", re.IGNORECASE)
+_QUESTION_RE = re.compile(r"\?|\b(?:what|how|when)\b", re.IGNORECASE)
+
+Sentiment = Literal["positive", "neutral", "negative"]
+
+
+class ReplyAnalysis(BaseModel):
+    intent: Literal["booking_request", "service_denial", "irrelevant_confused", "question"]
+    sentiment: Sentiment
+
+
+class SentimentAnalysis(BaseModel):
+    sentiment: Sentiment
+
+
+@lru_cache(maxsize=None)
+def _get_structured_llm(schema: type[BaseModel]):
+    # The schema constrains the output, so no post-parsing or allow-list check is needed
+    return _get_llm().with_structured_output(schema)
+
+
 def load_patient_and_campaign(state: Dict[str, Any]) -> Dict[str, Any]:
     thread_id = state.get("thread_id")
     patient_email = state.get("patient_email")
 
-    # Begin diagnostics
-    try:
+    # Begin diagnostics (extra dicts are only built when the record will be emitted)
+    log_info = logger.isEnabledFor(logging.INFO)
+    if log_info:
         logger.info(
             "agent.node.load_patient_and_campaign.begin",
             extra={
                 "thread_id": thread_id,
                 "patient_email": patient_email,
-                "db": settings.mongodb_db_name,
+                "db": settings.database_name,
                 "campaign_collection": settings.mongodb_campaign_collection,
             },
         )
-    except Exception:
-        pass
 
-    patient = find_patient_by_email(patient_email) if patient_email else None
+    patient, campaign = find_patient_with_latest_campaign(patient_email) if patient_email else (None, None)
     state["patient_id"] = patient.get("_id") if patient else None
 
-    campaign = None
-    if state.get("patient_id"):
-        campaign = find_latest_campaign_by_patient_id(state["patient_id"])
-        if campaign and thread_id:
-            ensure_campaign_thread_id(campaign["_id"], thread_id)
+    if campaign and thread_id:
+        # Link the campaign to this Gmail thread up front so later replies match even if this run fails
+        update_campaign_fields(campaign["_id"], {"channel.thread_id": thread_id}, state.get("now"))
     # End diagnostics
-    try:
+    if log_info:
         logger.info(
             "agent.node.load_patient_and_campaign.end",
             extra={
@@ -68,8 +110,6 @@ def load_patient_and_campaign(state: Dict[str, Any]) -> Dict[str, Any]:
                 "would_update_thread": bool(campaign and thread_id),
             },
         )
-    except Exception:
-        pass
 
     state["campaign"] = campaign or {}
     return state
@@ -81,13 +121,11 @@ def analyze_incoming(state: Dict[str, Any]) -> Dict[str, Any]:
         raise ValueError("reply_email_body is required in state")
 
     if not settings.openai_api_key:
-        lower = reply_body.lower()
-        intent = "question"
-        if any(k in lower for k in ["book", "schedule", "appointment", "time slot"]):
+        if _BOOKING_RE.search(reply_body):
             intent = "booking_request"
-        elif any(k in lower for k in ["no", "not interested", "stop", "unsubscribe"]):
+        elif _DENIAL_RE.search(reply_body):
             intent = "service_denial"
-        elif any(k in lower for k in ["what", "how", "when", "?"]):
+        elif _QUESTION_RE.search(reply_body):
             intent = "question"
         else:
             intent = "irrelevant_confused"
@@ -96,86 +134,82 @@ def analyze_incoming(state: Dict[str, Any]) -> Dict[str, Any]:
         state["incoming_sentiment"] = sentiment
         return state
 
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    intent_prompt = INTENT_CLASSIFIER_PROMPT.format(reply_email_body=reply_body)
-    intent_resp = llm.invoke(intent_prompt)
-    intent_text = intent_resp.content.strip().lower()
-    state["classified_intent"] = intent_text if intent_text in ALLOWED_INTENTS else "question"
-
-    # simple sentiment prompt
-    sent = llm.invoke(f"Classify sentiment of this text as positive, neutral, or negative: {reply_body}")
-    state["incoming_sentiment"] = sent.content.strip().lower()
+    # Intent and sentiment come back from a single structured call
+    analysis = _get_structured_llm(ReplyAnalysis).invoke(REPLY_ANALYSIS_PROMPT.format(reply_email_body=reply_body))
+    state["classified_intent"] = analysis.intent
+    state["incoming_sentiment"] = analysis.sentiment
     return state
 
 
-def generate_booking_email(state: Dict[str, Any]) -> Dict[str, Any]:
-    booking_id = str(uuid.uuid4())
-    link = f"{settings.booking_base_url}"
-    patient_name = (
-        state.get("campaign", {}).get("patient", {}).get("name")
-        or state.get("campaign", {}).get("patient_name")
+# Reply bodies as pre-bound str.format callables; only the name (and link/answer) vary per email
+_BOOKING_BODY = (
+    "Hi {name},\n\n"
+    "Thanks for your reply. You can choose a convenient time using the link below:\n"
+    "{link}\n\n"
+    "If you have any questions, just reply to this email.\n\n"
+    "Best,\nBright Smile Clinic Team"
+    "Contact us at +55 (11) 4567-8910"
+).format
+_DISAMBIGUATION_BODY = (
+    "Hello {name},\n\n"
+    "Thank you for your reply. I was unable to understand your message clearly.\n"
+    "To ensure you get the help you need, please feel free to call our patient helpline directly at +91 27017 35235.\n"
+    "Our team there will be happy to assist you.\n\n"
+    "Thank you."
+).format
+_DECLINED_BODY = (
+    "Hello {name},\n\n"
+    "We have received your message. You will not receive any further automated communications from us for this campaign.\n"
+    "We wish you all the best."
+).format
+_ANSWER_BODY = (
+    "Hello {name},\n\n"
+    "Thank you for your question. Here is the information you requested:\n\n"
+    "{answer}\n\n"
+    "If anything is unclear, feel free to reply to this email."
+).format
+_HANDOFF_BODY = (
+    "Hello {name},\n\n"
+    "Thank you for your question. Our team will review it and get back to you shortly."
+).format
+
+
+def _resolve_patient_name(state: Dict[str, Any]) -> str:
+    campaign = state.get("campaign") or {}
+    return (
+        (campaign.get("patient") or {}).get("name")
+        or campaign.get("patient_name")
         or state.get("patient_name")
         or "there"
     )
-    email_content = (
-        f"Hi {patient_name},\n\n"
-        f"Thanks for your reply. You can choose a convenient time using the link below:\n"
-        f"{link}\n\n"
-        f"If you have any questions, just reply to this email.\n\n"
-        f"Best,\nBright Smile Clinic Team"
-        f"Contact us at +55 (11) 4567-8910"
-    )
+
+
+def _reply_subject(state: Dict[str, Any], default: str) -> str:
+    inbound_subject = state.get("inbound_subject")
+    if inbound_subject and not inbound_subject.lower().startswith("re:"):
+        return f"Re: {inbound_subject}"
+    return inbound_subject or default
+
+
+def generate_booking_email(state: Dict[str, Any]) -> Dict[str, Any]:
+    link = f"{settings.booking_base_url}"
     state["booking_link"] = link
-    state["email_content"] = email_content
+    state["email_content"] = _BOOKING_BODY(name=_resolve_patient_name(state), link=link)
     # Preserve threading-friendly subject: use Re: <inbound subject> if available
-    inbound_subject = state.get("inbound_subject")
-    subject = f"Re: {inbound_subject}" if inbound_subject and not inbound_subject.lower().startswith("re:") else (inbound_subject or "Schedule your appointment")
-    state["subject"] = subject
+    state["subject"] = _reply_subject(state, "Schedule your appointment")
     return state
 
 
 def generate_disambiguation_email(state: Dict[str, Any]) -> Dict[str, Any]:
-    patient_name = (
-        state.get("campaign", {}).get("patient", {}).get("name")
-        or state.get("campaign", {}).get("patient_name")
-        or state.get("patient_name")
-        or "there"
-    )
     # Static template per spec with hardcoded helpline
-    body = (
-        f"Hello {patient_name},\n\n"
-        "Thank you for your reply. I was unable to understand your message clearly.\n"
-        "To ensure you get the help you need, please feel free to call our patient helpline directly at +91 27017 35235.\n"
-        "Our team there will be happy to assist you.\n\n"
-        "Thank you."
-    )
-    inbound_subject = state.get("inbound_subject")
-    subject = (
-        f"Re: {inbound_subject}" if inbound_subject and not inbound_subject.lower().startswith("re:") else (inbound_subject or "Quick clarification")
-    )
-    state["email_content"] = body
-    state["subject"] = subject
+    state["email_content"] = _DISAMBIGUATION_BODY(name=_resolve_patient_name(state))
+    state["subject"] = _reply_subject(state, "Quick clarification")
     return state
 
 
 def generate_declined_email(state: Dict[str, Any]) -> Dict[str, Any]:
-    patient_name = (
-        state.get("campaign", {}).get("patient", {}).get("name")
-        or state.get("campaign", {}).get("patient_name")
-        or state.get("patient_name")
-        or "there"
-    )
-    body = (
-        f"Hello {patient_name},\n\n"
-        "We have received your message. You will not receive any further automated communications from us for this campaign.\n"
-        "We wish you all the best."
-    )
-    inbound_subject = state.get("inbound_subject")
-    subject = (
-        f"Re: {inbound_subject}" if inbound_subject and not inbound_subject.lower().startswith("re:") else (inbound_subject or "Confirmation")
-    )
-    state["email_content"] = body
-    state["subject"] = subject
+    state["email_content"] = _DECLINED_BODY(name=_resolve_patient_name(state))
+    state["subject"] = _reply_subject(state, "Confirmation")
     return state
 
 ## generate_clarify_email was reverted per request
@@ -185,13 +219,16 @@ def record_incoming_interaction(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign = state.get("campaign", {})
     campaign_id: Optional[ObjectId] = campaign.get("_id")
     if campaign_id:
-        insert_interaction(
+        doc = build_interaction(
             campaign_id=campaign_id,
             direction="incoming",
             content=state.get("reply_email_body", ""),
             intent=state.get("classified_intent"),
             sentiment=state.get("incoming_sentiment"),
         )
+        # Persisted right away: a later send/LLM failure must not lose the patient's message, and the
+        # status writes on the branches below need this interaction to explain them
+        insert_interactions([doc])
     return state
 
 
@@ -199,7 +236,7 @@ def update_campaign_to_declined(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign = state.get("campaign", {})
     campaign_id: Optional[ObjectId] = campaign.get("_id")
     if campaign_id:
-        set_campaign_declined(campaign_id)
+        set_campaign_declined(campaign_id, state.get("now"))
     return state
 
 
@@ -232,7 +269,8 @@ def send_reply_email(state: Dict[str, Any]) -> Dict[str, Any]:
         references=references,
         from_email=None,  # let Gmail set From of the authorized account for best threading
     )
-    print("---email sent---")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("agent.node.send_reply_email.sent", extra={"gmail_message_id": resp.get("id"), "thread_id": resp.get("threadId")})
     state["send_result"] = {
         "status": "sent",
         "to": to_email,
@@ -254,9 +292,8 @@ def analyze_outgoing(state: Dict[str, Any]) -> Dict[str, Any]:
         state["outgoing_sentiment"] = "neutral"
         state["outgoing_intent"] = state.get("classified_intent")
         return state
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    sent = llm.invoke(f"Classify sentiment of this text as positive, neutral, or negative: {body}")
-    state["outgoing_sentiment"] = sent.content.strip().lower()
+    analysis = _get_structured_llm(SentimentAnalysis).invoke(SENTIMENT_PROMPT.format(text=body))
+    state["outgoing_sentiment"] = analysis.sentiment
     state["outgoing_intent"] = state.get("classified_intent")
     return state
 
@@ -265,13 +302,14 @@ def record_outgoing_interaction(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign = state.get("campaign", {})
     campaign_id: Optional[ObjectId] = campaign.get("_id")
     if campaign_id:
-        insert_interaction(
+        doc = build_interaction(
             campaign_id=campaign_id,
             direction="outgoing",
             content=state.get("email_content", ""),
             intent=state.get("outgoing_intent"),
             sentiment=state.get("outgoing_sentiment"),
         )
+        state["pending_interactions"] = [*state.get("pending_interactions", []), doc]
     return state
 
 
@@ -281,7 +319,9 @@ def update_campaign_status(state: Dict[str, Any]) -> Dict[str, Any]:
     thread_id = state.get("thread_id")
     link = state.get("booking_link")
     if campaign_id and thread_id and link:
-        set_campaign_form_sent(campaign_id, link, thread_id)
+        # Persisted by ai_summary together with the engagement summary in one update
+        fields = campaign_form_sent_fields(link, thread_id, state.get("now") or datetime.now(timezone.utc))
+        state["campaign_updates"] = {**state.get("campaign_updates", {}), **fields}
     return state
 
 
@@ -291,13 +331,25 @@ def ai_summary(state: Dict[str, Any]) -> Dict[str, Any]:
     if not campaign_id:
         return state
 
-    interactions = fetch_interactions_for_campaign(campaign_id)
-    if not interactions:
+    # Flush the buffered outgoing interaction before reading the history back
+    insert_interactions(state.get("pending_interactions", []))
+    state["pending_interactions"] = []
+    updates = state.get("campaign_updates", {})
+
+    # Summaries are incremental: only messages after the last summarized one are sent, along with
+    # the stored summary, so prompt size tracks the new messages rather than the whole thread
+    previous_summary = campaign.get("engagement_summary")
+    last_summary_at = campaign.get("last_summary_at") if previous_summary else None
+    history_lines = []
+    last_ts = None
+    for i in fetch_interactions_for_campaign(campaign_id, since=last_summary_at):
+        last_ts = i["timestamp"]
+        history_lines.append(f"{last_ts.isoformat()} | {i['direction']}: {i['content']}")
+    if not history_lines:
+        if updates:
+            update_campaign_fields(campaign_id, updates, state.get("now"))
         return state
 
-    history_lines = [
-        f"{i['timestamp'].isoformat()} | {i['direction']}: {i['content']}" for i in interactions
-    ]
     history = "\n".join(history_lines)
     format_spec = (
         "Overall Summary-\n"
@@ -307,21 +359,42 @@ def ai_summary(state: Dict[str, Any]) -> Dict[str, Any]:
         "<timestamp iso>: <short summary of message 2>\n\n"
         "..."
     )
-    prompt = (
-        "You are an analyst. Read the conversation history below (each line is 'ISO_TIMESTAMP | direction: content').\n"
-        "Produce a concise analytical summary in EXACTLY this format (no extra text):\n\n"
-        f"{format_spec}\n\n"
-        f"Conversation History:\n{history}"
-    )
+    if last_summary_at:
+        prompt = (
+            "You are an analyst. Below is the existing summary of a conversation, followed by new messages "
+            "(each line is 'ISO_TIMESTAMP | direction: content').\n"
+            "Produce the updated summary covering the whole conversation in EXACTLY this format (no extra text), "
+            "keeping the existing chatwise entries and appending the new ones:\n\n"
+            f"{format_spec}\n\n"
+            f"Existing Summary:\n{previous_summary}\n\n"
+            f"New Messages:\n{history}"
+        )
+    else:
+        prompt = (
+            "You are an analyst. Read the conversation history below (each line is 'ISO_TIMESTAMP | direction: content').\n"
+            "Produce a concise analytical summary in EXACTLY this format (no extra text):\n\n"
+            f"{format_spec}\n\n"
+            f"Conversation History:\n{history}"
+        )
 
     if not settings.openai_api_key:
         summary_text = history_lines[-1] if history_lines else ""
     else:
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-        resp = llm.invoke(prompt)
-        summary_text = resp.content
-
-    update_engagement_summary(campaign_id, summary_text)
+        try:
+            llm = _get_llm()
+            resp = llm.invoke(prompt)
+            summary_text = resp.content
+        except Exception:
+            # Don't lose the deferred status transition if summarization fails
+            if updates:
+                update_campaign_fields(campaign_id, updates, state.get("now"))
+            raise
+
+    update_campaign_fields(
+        campaign_id,
+        {**updates, "engagement_summary": summary_text, "last_summary_at": last_ts},
+        state.get("now"),
+    )
     return state
 
 
@@ -332,43 +405,37 @@ def query_knowledge_base(state: Dict[str, Any]) -> Dict[str, Any]:
         state["kb_answer"] = "NO_ANSWER"
         return state
     if not settings.openai_api_key:
-        # Fallback: naive match within KB text
-        lowered = question.lower()
-        if any(k in lowered for k in ["implant", "implante"]):
-            snippet = "Dental implants are a permanent solution for missing teeth; they look, feel, and function like natural teeth."
-            state["kb_answer"] = snippet
-            return state
-        state["kb_answer"] = "NO_ANSWER"
+        # Fallback: best-matching KB section from the prebuilt term index
+        state["kb_answer"] = search_kb(question) or "NO_ANSWER"
         return state
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    prompt = KB_QA_PROMPT.format(knowledge_base_text=KB_TEXT, patient_question=question)
-    resp = llm.invoke(prompt)
-    answer = (resp.content or "").strip()
-    state["kb_answer"] = answer if answer else "NO_ANSWER"
+    state["kb_answer"] = _answer_kb_question(question)
     return state
 
 
+def _answer_kb_question(question: str) -> str:
+    # Answers only depend on (KB text, question). Caches are keyed on the lowercased, whitespace-collapsed
+    # text so trivial variants share an entry, but the LLM sees the question as written (names, drug names)
+    normalized_question = " ".join(question.lower().split())
+    with _kb_answer_memo_lock:
+        memo = _kb_answer_memo.get(normalized_question)
+    if memo is not None:
+        return memo
+    key = hashlib.blake2b(f"{_KB_HASH}|{normalized_question}".encode("utf-8")).hexdigest()
+    answer = find_cached_kb_answer(key)
+    if answer is None:
+        llm = _get_llm()
+        resp = llm.invoke([SystemMessage(content=KB_SYSTEM_PROMPT), HumanMessage(content=question)])
+        answer = (resp.content or "").strip() or "NO_ANSWER"
+        store_kb_answer(key, answer)
+    with _kb_answer_memo_lock:
+        _kb_answer_memo[normalized_question] = answer
+    return answer
+
+
 def generate_answer_email(state: Dict[str, Any]) -> Dict[str, Any]:
     answer = state.get("kb_answer", "NO_ANSWER")
-    patient_name = (
-        state.get("campaign", {}).get("patient", {}).get("name")
-        or state.get("campaign", {}).get("patient_name")
-        or state.get("patient_name")
-        or "there"
-    )
-    body = (
-        f"Hello {patient_name},\n\n"
-        "Thank you for your question. Here is the information you requested:\n\n"
-        f"{answer}\n\n"
-        "If anything is unclear, feel free to reply to this email."
-    )
-    inbound_subject = state.get("inbound_subject")
-    subject = (
-        f"Re: {inbound_subject}" if inbound_subject and not inbound_subject.lower().startswith("re:") else (inbound_subject or "Your question")
-    )
-    state["email_content"] = body
-    state["subject"] = subject
-
+    state["email_content"] = _ANSWER_BODY(name=_resolve_patient_name(state), answer=answer)
+    state["subject"] = _reply_subject(state, "Your question")
     return state
 
 
@@ -377,27 +444,13 @@ def update_campaign_for_handoff(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign_id: Optional[ObjectId] = campaign.get("_id")
     if campaign_id:
         from .db import set_campaign_handoff_required
-        set_campaign_handoff_required(campaign_id)
+        set_campaign_handoff_required(campaign_id, state.get("now"))
     return state
 
 
 def generate_handoff_email(state: Dict[str, Any]) -> Dict[str, Any]:
-    patient_name = (
-        state.get("campaign", {}).get("patient", {}).get("name")
-        or state.get("campaign", {}).get("patient_name")
-        or state.get("patient_name")
-        or "there"
-    )
-    body = (
-        f"Hello {patient_name},\n\n"
-        "Thank you for your question. Our team will review it and get back to you shortly."
-    )
-    inbound_subject = state.get("inbound_subject")
-    subject = (
-        f"Re: {inbound_subject}" if inbound_subject and not inbound_subject.lower().startswith("re:") else (inbound_subject or "We will get back to you")
-    )
-    state["email_content"] = body
-    state["subject"] = subject
+    state["email_content"] = _HANDOFF_BODY(name=_resolve_patient_name(state))
+    state["subject"] = _reply_subject(state, "We will get back to you")
     return state
 
 
@@ -405,5 +458,5 @@ def update_campaign_re_engaged(state: Dict[str, Any]) -> Dict[str, Any]:
     campaign = state.get("campaign", {})
     campaign_id: Optional[ObjectId] = campaign.get("_id")
     if campaign_id:
-        set_campaign_re_engaged(campaign_id)
+        set_campaign_re_engaged(campaign_id, state.get("now"))
     return state
\ No newline at end of file
@@ -1,13 +1,12 @@
-INTENT_CLASSIFIER_PROMPT = (
+REPLY_ANALYSIS_PROMPT = (
     "You are an AI assistant processing inbound emails for a healthcare clinic. "
-    "Read the user's email reply and classify its primary intent. "
-    "You must choose one of the following four intents only: "
-    "booking_request, service_denial, irrelevant_confused, question. "
-    "Respond with only the chosen intent string and nothing else. "
+    "Read the user's email reply, classify its primary intent and its sentiment. "
+    "The intent must be one of: booking_request, service_denial, irrelevant_confused, question. "
+    "The sentiment must be one of: positive, neutral, negative. "
     "Email: '{reply_email_body}'"
 )
 
-ALLOWED_INTENTS = {"booking_request", "service_denial", "irrelevant_confused", "question"}
+SENTIMENT_PROMPT = "Classify sentiment of this text as positive, neutral, or negative: {text}"
 
 # Knowledge base QA
 KB_TEXT = (
@@ -44,13 +43,14 @@ KB_TEXT = (
     "    - A: Please call our main clinic number immediately. We set aside time for emergency appointments every day.\n"
 )
 
-KB_QA_PROMPT = (
+# Static rules + KB form one stable system message so the provider's prompt cache can reuse the prefix;
+# only the patient's question (sent as the user message) varies per call
+KB_SYSTEM_PROMPT = (
     "You are a specialized AI assistant for the Bright Smile Clinic. Your task is to answer a patient's question based exclusively on the provided knowledge base.\n\n"
     "RULES:\n\n"
-    "1. Read the user's [QUESTION] and carefully search the [KNOWLEDGE_BASE] text for the answer.\n"
+    "1. Read the user's question and carefully search the [KNOWLEDGE_BASE] text for the answer.\n"
     "2. If you find a clear and direct answer, provide only that information.\n"
     "3. If the answer is not found, you MUST respond with the single, exact string: NO_ANSWER.\n"
     "4. Do not use external knowledge or make assumptions. Your knowledge is strictly limited to the text provided.\n\n"
-    "[KNOWLEDGE_BASE]:\n\n{knowledge_base_text}\n\n"
-    "[QUESTION]:\n\n{patient_question}"
+    "[KNOWLEDGE_BASE]:\n\n" + KB_TEXT
 )
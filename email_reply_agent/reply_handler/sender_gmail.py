@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import base64
-from email.message import EmailMessage
+import os
+import threading
+from email.header import Header
+from email.utils import formataddr, parseaddr
 from typing import Optional
 
-from googleapiclient.discovery import build
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.credentials import Credentials
 
-from .config import settings
+from core.config import settings
+from services.http_client import DEFAULT_TIMEOUT
 
 
 GMAIL_SCOPES = [
@@ -16,10 +20,78 @@ GMAIL_SCOPES = [
     "https://www.googleapis.com/auth/gmail.modify",
 ]
 
+GMAIL_SEND_URL = "https://gmail.googleapis.com/gmail/v1/users/me/messages/send"
 
-def _build_service():
-    creds = Credentials.from_authorized_user_file(settings.google_token_file, scopes=GMAIL_SCOPES)
-    return build("gmail", "v1", credentials=creds, cache_discovery=False)
+_session_lock = threading.Lock()
+_session: Optional[tuple[float, AuthorizedSession]] = None
+
+
+def _get_session() -> AuthorizedSession:
+    # One keep-alive REST session (urllib3 pool + auto token refresh) instead of a discovery-built
+    # client per send; rebuilt only when the token file changes on disk
+    global _session
+    mtime = os.stat(settings.google_token_file).st_mtime
+    with _session_lock:
+        if _session is None or _session[0] != mtime:
+            creds = Credentials.from_authorized_user_file(settings.google_token_file, scopes=GMAIL_SCOPES)
+            _session = (mtime, AuthorizedSession(creds))
+        return _session[1]
+
+
+_MIME_TRAILER = (
+    b"MIME-Version: 1.0\r\n"
+    b'Content-Type: text/plain; charset="utf-8"\r\n'
+    b"Content-Transfer-Encoding: base64\r\n"
+    b"\r\n"
+)
+
+
+def _header_value(value: str) -> bytes:
+    # Collapse CR/LF (no header injection); RFC 2047-encode only when the value isn't plain ASCII
+    value = " ".join(value.split())
+    if value.isascii():
+        return value.encode("ascii")
+    # Long values fold across lines; fold with CRLF like every other line of the hand-built message
+    return Header(value, "utf-8").encode(linesep="\r\n").encode("ascii")
+
+
+def _address_header_value(value: str) -> bytes:
+    # To/From: RFC 2047-encode only the display name; an encoded addr-spec is unroutable
+    value = " ".join(value.split())
+    if value.isascii():
+        return value.encode("ascii")
+    name, addr = parseaddr(value)
+    if not addr:
+        return _header_value(value)
+    if not addr.isascii():
+        # Internationalized mailbox: formataddr can't carry it, send the header as raw UTF-8
+        return value.encode("utf-8")
+    return formataddr((name, addr), charset="utf-8").encode("ascii")
+
+
+def _build_mime(
+    *,
+    to_email: str,
+    subject: str,
+    body_text: str,
+    in_reply_to: Optional[str],
+    references: Optional[str],
+    from_email: Optional[str],
+) -> bytes:
+    # Plain-text replies only need a handful of fixed headers, so assemble the RFC 5322 bytes
+    # directly instead of going through EmailMessage's policy/generator machinery
+    parts = [b"To: " + _address_header_value(to_email) + b"\r\n"]
+    if from_email:
+        parts.append(b"From: " + _address_header_value(from_email) + b"\r\n")
+    parts.append(b"Subject: " + _header_value(subject) + b"\r\n")
+    if in_reply_to:
+        parts.append(b"In-Reply-To: " + _header_value(in_reply_to) + b"\r\n")
+    if references:
+        # Fold one Message-Id per line so long threads stay under the 998-octet line limit
+        parts.append(b"References: " + b"\r\n ".join(_header_value(ref) for ref in references.split()) + b"\r\n")
+    parts.append(_MIME_TRAILER)
+    parts.append(base64.encodebytes(body_text.encode("utf-8")).replace(b"\n", b"\r\n"))
+    return b"".join(parts)
 
 
 def send_gmail_message(
@@ -32,22 +104,21 @@ def send_gmail_message(
     references: Optional[str] = None,
     from_email: Optional[str] = None,
 ) -> dict:
-    service = _build_service()
-
-    msg = EmailMessage()
-    msg["To"] = to_email
-    if from_email:
-        msg["From"] = from_email
-    msg["Subject"] = subject
-    if in_reply_to:
-        msg["In-Reply-To"] = in_reply_to
-    if references:
-        msg["References"] = references
-    msg.set_content(body_text)
+    session = _get_session()
 
-    raw = base64.urlsafe_b64encode(msg.as_bytes()).decode("utf-8")
+    mime = _build_mime(
+        to_email=to_email,
+        subject=subject,
+        body_text=body_text,
+        in_reply_to=in_reply_to,
+        references=references,
+        from_email=from_email,
+    )
+    raw = base64.urlsafe_b64encode(mime).decode("ascii")
     body = {"raw": raw}
     if thread_id:
         body["threadId"] = thread_id
 
-    return service.users().messages().send(userId="me", body=body).execute()
+    resp = session.post(GMAIL_SEND_URL, json=body, timeout=DEFAULT_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import Any, Dict, TypedDict
+from datetime import datetime
+from typing import Any, Dict, List, TypedDict
 
 
 class ReplyState(TypedDict, total=False):
     thread_id: str
     reply_email_body: str
+    # Single timestamp shared by every campaign write in one workflow run
+    now: datetime
 
     # Optional fallbacks from the request
     patient_email: str
@@ -32,3 +35,7 @@ class ReplyState(TypedDict, total=False):
 
     # Question branch
     kb_answer: str
+
+    # Writes deferred to ai_summary: interaction docs for one insert_many and campaign $set fields
+    pending_interactions: List[Dict[str, Any]]
+    campaign_updates: Dict[str, Any]
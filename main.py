@@ -1,31 +1,33 @@
 from __future__ import annotations
 
+# Load .env exactly once, before any module reads settings from the environment
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import asyncio
 import logging
-from logging.config import dictConfig
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 import os
-
-from api.v1.router import api_router
-from typing import Any, Dict
+import time
 import warnings
+from logging.config import dictConfig
+from typing import Any, Dict, Optional
 
-from fastapi import FastAPI
-from pydantic import BaseModel
-
-from agent.graph import run
+import orjson
 from bson import ObjectId
-
-
-from typing import Optional, Dict, Any
 from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel, Field
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, Field, field_validator
+from starlette.concurrency import run_in_threadpool
 
+from api.v1.router import api_router
+from api.v1.responses import MongoJSONResponse
+from db.database import close_mongo_client, ensure_indexes
 from email_reply_agent.reply_handler.graph import run_reply_workflow
-from services.gmail.processor import process_pubsub_push
-from email_reply_agent.reply_handler.config import settings
-from services.gmail.client import start_watch, build_gmail_service
-from email_reply_agent.reply_handler.db import set_last_history_id, get_last_history_id
+from services.gmail.processor import process_pubsub_push_batch
+from core.config import settings
+from services.gmail.client import start_watch, get_mailbox_email
+from email_reply_agent.reply_handler.db import set_last_history_id, get_last_history_id, flush_pending_history_ids
 
 try:
     # Suppress urllib3 OpenSSL warning on macOS LibreSSL (harmless for local HTTP)
@@ -36,10 +38,36 @@ except Exception:
     pass
 
 
+# CORS origins parsed once at import
+_ORIGINS_ENV = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").strip()
+_ALLOW_ALL_ORIGINS = _ORIGINS_ENV in {"*", '"*"'}
+_ALLOWED_ORIGINS = tuple(o.strip() for o in _ORIGINS_ENV.split(",") if o.strip())
+
+# Gmail watch labels parsed once at import
+_WATCH_LABEL_IDS = tuple(lbl.strip() for lbl in settings.gmail_label_ids_default.split(",") if lbl.strip()) or ("INBOX",)
+_WATCH_LABEL_ACTION = settings.gmail_label_filter_action_default or "include"
+
+# Upper bound between Gmail watch refreshes (seconds)
+_WATCH_REFRESH_MAX = 12 * 60 * 60
+
+# Push workers coalesce up to this many queued pushes, waiting at most this long (seconds) for more
+_PUSH_BATCH_MAX = 64
+_PUSH_BATCH_WAIT = 0.05
+
+
 class TriggerPayload(BaseModel):
     patient: Dict[str, Any]
     campaign: Dict[str, Any]
 
+    @field_validator("patient", "campaign")
+    @classmethod
+    def _coerce_object_id(cls, doc: Dict[str, Any]) -> Dict[str, Any]:
+        # Convert a 24-hex "_id" once while parsing so the handler gets Mongo-ready docs
+        oid = doc.get("_id")
+        if isinstance(oid, str) and len(oid) == 24 and ObjectId.is_valid(oid):
+            doc["_id"] = ObjectId(oid)
+        return doc
+
 class InboundReply(BaseModel):
     thread_id: str = Field(..., description="Email thread/conversation identifier")
     reply_email_body: str = Field(..., description="Plain text body of the patient's reply")
@@ -78,13 +106,29 @@ configure_logging()
 logger = logging.getLogger(__name__)
 
 
+def _start_watch_with_baseline() -> Dict[str, Any]:
+    # Blocking Gmail + Mongo calls; run from async code via run_in_threadpool
+    resp = start_watch(
+        topic_name=settings.gmail_topic_name,
+        label_ids=list(_WATCH_LABEL_IDS),
+        label_filter_action=_WATCH_LABEL_ACTION,
+        user_id="me",
+    )
+    # Set baseline only if none is stored for the mailbox
+    email_addr = get_mailbox_email()
+    baseline_history = resp.get("historyId")
+    if baseline_history and email_addr and not get_last_history_id(email_addr):
+        set_last_history_id(email_addr, str(baseline_history))
+        logger.info("gmail.watch_baseline_saved", extra={"email": email_addr, "historyId": str(baseline_history)})
+    return resp
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="Mundos AI Backend", version="0.1.0")
+    # orjson rendering for every route (ObjectId/Enum aware) instead of stdlib json
+    app = FastAPI(title="Mundos AI Backend", version="0.1.0", default_response_class=MongoJSONResponse)
 
     # Configure CORS
-    origins_env = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").strip()
-    allow_all_origins = origins_env in {"*", '"*"'}
-    if allow_all_origins:
+    if _ALLOW_ALL_ORIGINS:
         # Wildcard: allow all origins, without credentials per CORS spec
         app.add_middleware(
             CORSMiddleware,
@@ -94,10 +138,9 @@ def create_app() -> FastAPI:
             allow_headers=["*"],
         )
     else:
-        allowed_origins = [o.strip() for o in origins_env.split(",") if o.strip()]
         app.add_middleware(
             CORSMiddleware,
-            allow_origins=allowed_origins,
+            allow_origins=list(_ALLOWED_ORIGINS),
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
@@ -105,15 +148,44 @@ def create_app() -> FastAPI:
 
     app.include_router(api_router, prefix="/api/v1")
 
+    # Caps in-flight agent runs per worker so a burst can't exhaust the LLM rate limit or the threadpool;
+    # callers beyond the wait limit get 429 instead of piling up
+    app.state.llm_sem = asyncio.Semaphore(settings.llm_concurrency)
+    llm_waiting = 0
+
+    async def run_agent_bounded(fn, *args, **kwargs):
+        nonlocal llm_waiting
+        sem = app.state.llm_sem
+        if sem.locked() and llm_waiting >= settings.llm_max_waiting:
+            raise HTTPException(status_code=429, detail="Agent busy", headers={"Retry-After": "5"})
+        llm_waiting += 1
+        try:
+            await sem.acquire()
+        finally:
+            llm_waiting -= 1
+        try:
+            return await run_in_threadpool(fn, *args, **kwargs)
+        finally:
+            sem.release()
+
+    inflight_triggers: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
     @app.post("/agent/trigger")
-    def trigger_agent(payload: TriggerPayload):
-        # print('=============>',payload)
-        # Ensure IDs are ObjectId where applicable
-        if isinstance(payload.patient.get("_id"), str) and len(payload.patient["_id"]) == 24:
-            payload.patient["_id"] = ObjectId(payload.patient["_id"])  # type: ignore
-        if isinstance(payload.campaign.get("_id"), str) and len(payload.campaign["_id"]) == 24:
-            payload.campaign["_id"] = ObjectId(payload.campaign["_id"])  # type: ignore
-        result = run(payload.patient, payload.campaign)
+    async def trigger_agent(payload: TriggerPayload):
+        # Outreach agent (LangGraph + LLM stack) is imported on first trigger, not at worker start
+        from agent.graph import run
+
+        # Triggers for a campaign whose run is still in flight share that run instead of
+        # generating and sending a second message; shield so one caller disconnecting doesn't cancel it
+        key = str(payload.campaign.get("_id") or "")
+        task = inflight_triggers.get(key) if key else None
+        if task is None:
+            # LLM + Mongo calls are blocking; keep them off the event loop
+            task = asyncio.ensure_future(run_agent_bounded(run, payload.patient, payload.campaign))
+            if key:
+                inflight_triggers[key] = task
+                task.add_done_callback(lambda _t: inflight_triggers.pop(key, None))
+        result = await asyncio.shield(task)
 
 
         return {"status": "ok", "keys": list(result.keys())}
@@ -123,24 +195,7 @@ def create_app() -> FastAPI:
         if not settings.gmail_topic_name:
             raise HTTPException(status_code=400, detail="GMAIL_TOPIC_NAME not configured")
         try:
-            label_ids = [lbl.strip() for lbl in settings.gmail_label_ids_default.split(",") if lbl.strip()]
-            resp = start_watch(
-                topic_name=settings.gmail_topic_name,
-                label_ids=label_ids or ["INBOX"],
-                label_filter_action=settings.gmail_label_filter_action_default or "include",
-                user_id="me",
-            )
-            # Resolve actual mailbox email address from Gmail profile
-            try:
-                svc = build_gmail_service()
-                profile = svc.users().getProfile(userId="me").execute()
-                email_addr = profile.get("emailAddress")
-            except Exception:
-                email_addr = settings.gmail_user_email
-            baseline_history = resp.get("historyId")
-            if baseline_history and email_addr and not get_last_history_id(email_addr):
-                set_last_history_id(email_addr, str(baseline_history))
-                logger.info("gmail.watch_baseline_saved", extra={"email": email_addr, "historyId": str(baseline_history)})
+            resp = await run_in_threadpool(_start_watch_with_baseline)
             return {"ok": True, "watch": resp}
         except Exception as exc:
             raise HTTPException(status_code=500, detail=str(exc))
@@ -149,7 +204,8 @@ def create_app() -> FastAPI:
     @app.post("/agent/reply")
     async def handle_inbound_reply(payload: InboundReply):
         try:
-            result = run_reply_workflow(
+            result = await run_agent_bounded(
+                run_reply_workflow,
                 thread_id=payload.thread_id,
                 reply_email_body=payload.reply_email_body,
                 patient_email=payload.patient_email,
@@ -161,6 +217,8 @@ def create_app() -> FastAPI:
                 "booking_link": result.get("booking_link"),
                 "send_result": result.get("send_result"),
             }
+        except HTTPException:
+            raise
         except Exception as exc:
             raise HTTPException(status_code=500, detail=str(exc))
         
@@ -170,46 +228,83 @@ def create_app() -> FastAPI:
         if settings.pubsub_verification_token and token != settings.pubsub_verification_token:
             raise HTTPException(status_code=403, detail="Invalid token")
 
-        body: Dict[str, Any] = await request.json()
+        body: Dict[str, Any] = orjson.loads(await request.body())
         logger.info("gmail.pubsub_push_received", extra={
             "has_message": bool(body.get("message")),
             "has_attributes": bool((body.get("message") or {}).get("attributes")),
         })
+        # Ack fast and let the push workers do the Gmail/agent work; a full queue nacks so Pub/Sub redelivers
         try:
-            result = process_pubsub_push(body)
-            logger.info("gmail.pubsub_processed", extra=result)
-            return result
-        except Exception as exc:
-            logger.exception("gmail.pubsub_error")
-            return {"ok": False, "error": str(exc)}
+            app.state.push_queue.put_nowait(body)
+        except asyncio.QueueFull:
+            logger.warning("gmail.pubsub_queue_full")
+            raise HTTPException(status_code=503, detail="Push queue full")
+        return {"ok": True, "queued": True}
+
+    @app.on_event("startup")
+    async def _push_workers_start():
+        app.state.push_queue = asyncio.Queue(maxsize=settings.pubsub_queue_size)
+
+        async def push_worker():
+            queue = app.state.push_queue
+            loop = asyncio.get_running_loop()
+            while True:
+                # Drain a short burst so one history walk per mailbox covers all of its pushes
+                batch = [await queue.get()]
+                deadline = loop.time() + _PUSH_BATCH_WAIT
+                while len(batch) < _PUSH_BATCH_MAX:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                try:
+                    for result in await run_in_threadpool(process_pubsub_push_batch, batch):
+                        logger.info("gmail.pubsub_processed", extra=result)
+                except Exception:
+                    logger.exception("gmail.pubsub_error")
+                finally:
+                    for _ in batch:
+                        queue.task_done()
+
+        app.state._push_workers = [asyncio.create_task(push_worker()) for _ in range(settings.pubsub_workers)]
+
+    @app.on_event("shutdown")
+    async def _push_workers_stop():
+        for task in getattr(app.state, "_push_workers", []):
+            task.cancel()
         
     @app.on_event("startup")
-    async def _auto_watch_start():
-        import asyncio, time
+    async def _size_threadpool():
+        import anyio.to_thread
 
+        # Blocking agent/Gmail work runs in AnyIO's worker threads; widen the default 40-token limiter
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+
+    @app.on_event("startup")
+    async def _ensure_indexes():
+        await ensure_indexes()
+
+    @app.on_event("shutdown")
+    async def _close_mongo_client():
+        await close_mongo_client()
+
+    @app.on_event("shutdown")
+    async def _close_smtp_pool():
+        from agent.services import close_smtp_pool
+
+        # QUIT round trips block; keep them off the event loop
+        await run_in_threadpool(close_smtp_pool)
+
+    @app.on_event("startup")
+    async def _auto_watch_start():
         async def start_or_refresh_watch() -> Optional[float]:
             if not settings.gmail_topic_name:
                 return None
             try:
-                label_ids = [lbl.strip() for lbl in settings.gmail_label_ids_default.split(",") if lbl.strip()]
-                resp = start_watch(
-                    topic_name=settings.gmail_topic_name,
-                    label_ids=label_ids or ["INBOX"],
-                    label_filter_action=settings.gmail_label_filter_action_default or "include",
-                    user_id="me",
-                )
-                # Set baseline only if none is stored
-                baseline_history = resp.get("historyId")
-                # Resolve mailbox email
-                try:
-                    svc = build_gmail_service()
-                    profile = svc.users().getProfile(userId="me").execute()
-                    email_addr = profile.get("emailAddress")
-                except Exception:
-                    email_addr = settings.gmail_user_email
-                if baseline_history and email_addr and not get_last_history_id(email_addr):
-                    set_last_history_id(email_addr, str(baseline_history))
-                    logger.info("gmail.watch_baseline_saved", extra={"email": email_addr, "historyId": str(baseline_history)})
+                resp = await run_in_threadpool(_start_watch_with_baseline)
                 # Return expiration (ms since epoch) if provided
                 exp = resp.get("expiration")
                 return float(exp) / 1000.0 if exp else None
@@ -219,18 +314,19 @@ def create_app() -> FastAPI:
         async def watch_maintainer():
             while True:
                 exp_sec = await start_or_refresh_watch()
-                # Compute next refresh time: 10 minutes before expiration, or fallback 12h
-                now = time.time()
+                # Next refresh 10 minutes before expiration, never later than 12h. Wall clock is only used
+                # against Gmail's epoch expiration; asyncio.sleep itself runs on the loop's monotonic clock,
+                # and the cap bounds how far a clock jump can push the next refresh
                 if exp_sec:
-                    delay = max(300.0, (exp_sec - now) - 600.0)
+                    delay = min(_WATCH_REFRESH_MAX, max(300.0, (exp_sec - time.time()) - 600.0))
                 else:
-                    delay = 12 * 60 * 60
+                    delay = _WATCH_REFRESH_MAX
                 try:
                     await asyncio.sleep(delay)
                 except asyncio.CancelledError:
                     break
 
-        app.state._watch_task = __import__("asyncio").create_task(watch_maintainer())
+        app.state._watch_task = asyncio.create_task(watch_maintainer())
 
     @app.on_event("shutdown")
     async def _auto_watch_stop():
@@ -238,6 +334,33 @@ def create_app() -> FastAPI:
         if task:
             task.cancel()
 
+    @app.on_event("startup")
+    async def _history_flush_start():
+        async def history_flusher():
+            # Persist coalesced Gmail historyId checkpoints every few seconds
+            while True:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    break
+                try:
+                    await run_in_threadpool(flush_pending_history_ids)
+                except Exception:
+                    logger.exception("gmail.history_flush_error")
+
+        app.state._history_flush_task = asyncio.create_task(history_flusher())
+
+    @app.on_event("shutdown")
+    async def _history_flush_stop():
+        task = getattr(app.state, "_history_flush_task", None)
+        if task:
+            task.cancel()
+        try:
+            # Final flush writes to Mongo synchronously; keep it off the event loop like the periodic one
+            await run_in_threadpool(flush_pending_history_ids)
+        except Exception:
+            logger.exception("gmail.history_flush_error")
+
     @app.get("/")
     async def root_health() -> dict[str, str]:
         return {"status": "ok"}
@@ -249,7 +372,22 @@ app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    app = create_app()
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+
+    if os.getenv("DEV"):
+        # Auto-reload is single-process only
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # uvloop + httptools; log_config=None keeps the JSON dictConfig above. Single process by default:
+        # the Gmail watch refresh, push queue/workers, history flusher, LLM semaphore and trigger dedupe
+        # are all per process, so WEB_CONCURRENCY > 1 multiplies them
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            loop="uvloop",
+            http="httptools",
+            log_config=None,
+        )
 
 
@@ -4,7 +4,9 @@ from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Sequence
 
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.operations import DeleteOne, InsertOne, UpdateMany, UpdateOne
 
 
 def utcnow() -> datetime:
@@ -12,13 +14,15 @@ def utcnow() -> datetime:
 
 
 class BaseRepository:
-    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+    def __init__(self, db: AsyncDatabase) -> None:
         self.db = db
 
     @staticmethod
     def _ensure_object_id(value: Any) -> ObjectId:
         if isinstance(value, ObjectId):
             return value
+        if isinstance(value, str):
+            return ObjectId(value)
         return ObjectId(str(value))
 
     async def find_many(
@@ -29,8 +33,9 @@ class BaseRepository:
         sort: Optional[Sequence[tuple[str, int]]] = None,
         limit: Optional[int] = None,
         skip: Optional[int] = None,
+        projection: Optional[Dict[str, Any]] = None,
     ) -> List[Dict[str, Any]]:
-        cursor = self.db[collection].find(query or {})
+        cursor = self.db[collection].find(query or {}, projection)
         if sort:
             cursor = cursor.sort(list(sort))
         if skip:
@@ -39,11 +44,26 @@ class BaseRepository:
             cursor = cursor.limit(limit)
         return [doc async for doc in cursor]
 
+    async def aggregate(self, collection: str, pipeline: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # PyMongo's async aggregate is a coroutine returning the cursor (Motor's returned it directly)
+        cursor = await self.db[collection].aggregate(list(pipeline))
+        return [doc async for doc in cursor]
+
     async def count_many(self, collection: str, query: Dict[str, Any] | None = None) -> int:
         return await self.db[collection].count_documents(query or {})
 
-    async def find_one(self, collection: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        return await self.db[collection].find_one(query)
+    async def find_one(
+        self,
+        collection: str,
+        query: Dict[str, Any],
+        *,
+        projection: Optional[Dict[str, Any]] = None,
+        collation: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        # A collation must match the index's for the index to be used (e.g. EMAIL_COLLATION)
+        if collation is not None:
+            return await self.db[collection].find_one(query, projection, collation=collation)
+        return await self.db[collection].find_one(query, projection)
 
     async def insert_one(self, collection: str, doc: Dict[str, Any], *, with_timestamps: bool = True) -> ObjectId:
         # Special-case: never persist a null _id; MongoDB will auto-generate one
@@ -59,6 +79,36 @@ class BaseRepository:
         result = await self.db[collection].insert_one(doc)
         return result.inserted_id
 
+    async def insert_many(
+        self, collection: str, docs: Sequence[Dict[str, Any]], *, with_timestamps: bool = True
+    ) -> List[ObjectId]:
+        # One round trip for a batch; unordered so one bad doc doesn't stop the rest
+        if not docs:
+            return []
+        now = utcnow() if with_timestamps else None
+        prepared: List[Dict[str, Any]] = []
+        for doc in docs:
+            if doc.get("_id", "__absent__") is None:
+                doc = {k: v for k, v in doc.items() if k != "_id"}
+            if now is not None:
+                if doc.get("created_at") is None:
+                    doc["created_at"] = now
+                if doc.get("updated_at") is None:
+                    doc["updated_at"] = now
+            prepared.append(doc)
+        result = await self.db[collection].insert_many(prepared, ordered=False)
+        return list(result.inserted_ids)
+
+    async def bulk_write(
+        self,
+        collection: str,
+        ops: Sequence[InsertOne | UpdateOne | UpdateMany | DeleteOne],
+        *,
+        ordered: bool = False,
+    ) -> None:
+        if ops:
+            await self.db[collection].bulk_write(list(ops), ordered=ordered)
+
     async def update_one(
         self,
         collection: str,
@@ -74,6 +124,27 @@ class BaseRepository:
             update["$set"] = set_part
         await self.db[collection].update_one(filter_query, update)
 
+    async def find_one_and_update(
+        self,
+        collection: str,
+        filter_query: Dict[str, Any],
+        update: Dict[str, Any],
+        *,
+        upsert: bool = False,
+        return_after: bool = False,
+        projection: Optional[Dict[str, Any]] = None,
+        collation: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        kwargs: Dict[str, Any] = {"collation": collation} if collation is not None else {}
+        return await self.db[collection].find_one_and_update(
+            filter_query,
+            update,
+            projection=projection,
+            upsert=upsert,
+            return_document=ReturnDocument.AFTER if return_after else ReturnDocument.BEFORE,
+            **kwargs,
+        )
+
     async def delete_one(self, collection: str, query: Dict[str, Any]) -> None:
         await self.db[collection].delete_one(query)
 
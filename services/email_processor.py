@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import base64
-import json
 from typing import Any, Dict
 
-from db.database import get_database
-from repositories.base import BaseRepository, utcnow
+import orjson
+
+from db.database import get_repo
+from repositories.base import utcnow
 
 
 async def process_gmail_webhook(payload: Dict[str, Any]) -> None:
@@ -16,23 +17,26 @@ async def process_gmail_webhook(payload: Dict[str, Any]) -> None:
         return
     try:
         decoded_bytes = base64.b64decode(data_b64)
-        decoded_str = decoded_bytes.decode("utf-8")
     except Exception:
         return
 
     # 2. Mock fetch of Gmail thread -> extract thread_id and content
+    # orjson parses the bytes directly; the utf-8 decode is only needed for the non-JSON fallback
     try:
-        parsed = json.loads(decoded_str)
-    except json.JSONDecodeError:
+        parsed = orjson.loads(decoded_bytes)
+    except orjson.JSONDecodeError:
+        try:
+            decoded_str = decoded_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            return
         parsed = {"thread_id": "mock-thread-id", "content": decoded_str}
 
     thread_id = parsed.get("thread_id", "mock-thread-id")
     content = parsed.get("content", "")
 
     # 3. Find campaign by channel.thread_id
-    db = await get_database()
-    repo = BaseRepository(db)
-    campaign = await repo.find_one("campaigns", {"channel.thread_id": thread_id})
+    repo = await get_repo()
+    campaign = await repo.find_one("campaigns", {"channel.thread_id": thread_id}, projection={"_id": 1, "status": 1})
     if not campaign:
         return
 
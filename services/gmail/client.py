@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 import os
+import threading
+from functools import lru_cache
 from typing import Any, Dict, Optional, List
 
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 
-from email_reply_agent.reply_handler.config import settings
+from core.config import settings
 
 
 GMAIL_SCOPES = [
@@ -30,6 +32,49 @@ def build_gmail_service() -> Any:
     return service
 
 
+_local = threading.local()
+# Bumped by reset_gmail_service; every thread's cached client is stale once its generation lags
+_service_generation = 0
+
+
+def get_gmail_service() -> Any:
+    # httplib2 transports aren't thread-safe, so each worker thread keeps its own client (and its
+    # keep-alive connection + refreshed token); rebuilt when the token file changes on disk or after a reset
+    try:
+        mtime = os.stat(settings.google_token_file).st_mtime
+    except OSError:
+        # Missing/unreadable token: let load_credentials raise its descriptive error
+        return build_gmail_service()
+    generation = _service_generation
+    cached = getattr(_local, "service", None)
+    if cached is None or cached[0] != mtime or cached[1] != generation:
+        cached = (mtime, generation, build_gmail_service())
+        _local.service = cached
+    return cached[2]
+
+
+def reset_gmail_service() -> None:
+    # Invalidate every thread's cached client (e.g. after a 401) so each reloads the token file
+    global _service_generation
+    _service_generation += 1
+    _local.service = None
+
+
+@lru_cache(maxsize=1)
+def _profile_email() -> Optional[str]:
+    profile = get_gmail_service().users().getProfile(userId="me").execute()
+    return profile.get("emailAddress")
+
+
+def get_mailbox_email() -> Optional[str]:
+    # The address behind the OAuth token never changes, so getProfile runs once per process;
+    # failures aren't cached and fall back to the configured address
+    try:
+        return _profile_email() or settings.gmail_user_email
+    except Exception:
+        return settings.gmail_user_email
+
+
 def start_watch(
     *,
     topic_name: str,
@@ -37,7 +82,7 @@ def start_watch(
     label_filter_action: str = "include",
     user_id: str = "me",
 ) -> Dict[str, Any]:
-    service = build_gmail_service()
+    service = get_gmail_service()
     body: Dict[str, Any] = {
         "topicName": topic_name,
         "labelFilterAction": label_filter_action,
@@ -1,57 +1,88 @@
 from __future__ import annotations
 
 import base64
-import json
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 import logging
 from email.utils import parseaddr
 
+import orjson
 from html2text import html2text
 
-from .client import build_gmail_service
-from email_reply_agent.reply_handler.db import get_last_history_id, set_last_history_id, has_processed_message, mark_processed_message
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax wheel unavailable: keep the pure-Python converter
+    LexborHTMLParser = None
+
+from googleapiclient.errors import HttpError
+
+from .client import get_gmail_service, reset_gmail_service
+from email_reply_agent.reply_handler.db import get_last_history_id, queue_last_history_id, claim_messages, release_messages
 from email_reply_agent.reply_handler.graph import run_reply_workflow
-from email_reply_agent.reply_handler.config import settings
+from core.config import settings
 
 
 logger = logging.getLogger("services.gmail.processor")
 logger.setLevel(logging.INFO)
 
+# messages.get calls packed per batch HTTP request (Gmail advises staying at or under 50)
+_GET_BATCH_SIZE = 50
+
+# Fetches the next history page while the current one is being processed
+_history_prefetch = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gmail-history")
+
 
 def _decode_pubsub_message(data_b64: str) -> Dict[str, Any]:
-    decoded = base64.b64decode(data_b64)
-    return json.loads(decoded)
+    # orjson accepts the decoded bytes as-is, no intermediate str
+    return orjson.loads(base64.b64decode(data_b64))
 
 
-def _get_header(headers: List[Dict[str, str]], name: str) -> Optional[str]:
+def _header_map(headers: List[Dict[str, str]]) -> Dict[str, Optional[str]]:
+    # One pass over the headers with lowercased names; the first occurrence wins like the old linear lookup
+    hmap: Dict[str, Optional[str]] = {}
     for h in headers:
-        if h.get("name", "").lower() == name.lower():
-            return h.get("value")
-    return None
+        hmap.setdefault(h.get("name", "").lower(), h.get("value"))
+    return hmap
+
+
+def _html_to_text(html: str) -> str:
+    # Lexbor (C) parse + text-node join is much cheaper than html2text on large HTML-only emails
+    if LexborHTMLParser is None:
+        return html2text(html)
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style", "head"])
+    root = tree.body or tree.root
+    return root.text(separator="\n", strip=True) if root is not None else ""
 
 
 def _extract_plain_text(payload: Dict[str, Any]) -> str:
-    mime_type = payload.get("mimeType")
-    if mime_type == "text/plain":
-        data = payload.get("body", {}).get("data")
-        if data:
-            return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-        return ""
-    if mime_type == "text/html":
-        data = payload.get("body", {}).get("data")
-        if data:
-            html = base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-            return html2text(html)
-        return ""
-    parts = payload.get("parts", []) or []
-    for part in parts:
-        text = _extract_plain_text(part)
-        if text:
-            return text
+    # Iterative depth-first walk in document order: return the first non-empty text/plain part, and
+    # only pay for HTML conversion when the message has no plain alternative anywhere
+    html_fallback: Optional[str] = None
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        mime_type = part.get("mimeType")
+        if mime_type == "text/plain":
+            data = part.get("body", {}).get("data")
+            if data:
+                text = base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+                if text:
+                    return text
+        elif mime_type == "text/html":
+            if html_fallback is None:
+                html_fallback = part.get("body", {}).get("data")
+        else:
+            children = part.get("parts")
+            if children:
+                stack.extend(reversed(children))
+    if html_fallback:
+        html = base64.urlsafe_b64decode(html_fallback).decode("utf-8", errors="ignore")
+        return _html_to_text(html)
     return ""
 
 
-def process_pubsub_push(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
+def _decode_change(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
     message = pubsub_body.get("message", {})
     data_b64 = message.get("data")
     if not data_b64:
@@ -62,25 +93,101 @@ def process_pubsub_push(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
     history_id = change.get("historyId")
     if not email_address or not history_id:
         return {"ok": False, "reason": "missing_email_or_history"}
+    return {"ok": True, "emailAddress": email_address, "historyId": history_id}
+
+
+def process_pubsub_push(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
+    change = _decode_change(pubsub_body)
+    if not change["ok"]:
+        return change
+    return _process_mailbox_authed(change["emailAddress"], change["historyId"])
+
+
+def process_pubsub_push_batch(pubsub_bodies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Coalesce a burst of pushes: one history walk per mailbox starting from the stored checkpoint,
+    # falling back to the oldest pushed historyId when there is none yet
+    results: List[Dict[str, Any]] = []
+    oldest_by_mailbox: Dict[str, int] = {}
+    for body in pubsub_bodies:
+        change = _decode_change(body)
+        if not change["ok"]:
+            results.append(change)
+            continue
+        email_address = change["emailAddress"]
+        history_id = int(change["historyId"])
+        prev = oldest_by_mailbox.get(email_address)
+        oldest_by_mailbox[email_address] = history_id if prev is None else min(prev, history_id)
+    for email_address, history_id in oldest_by_mailbox.items():
+        # These pushes are already acked, so one failing mailbox must not cost the others their history
+        try:
+            results.append(_process_mailbox_authed(email_address, history_id))
+        except Exception as exc:
+            logger.exception("gmail.mailbox_failed", extra={"emailAddress": email_address, "historyId": history_id})
+            results.append({"ok": False, "email": email_address, "error": str(exc)})
+    return results
+
+
+def _process_mailbox_authed(email_address: str, history_id: Any) -> Dict[str, Any]:
+    try:
+        return _process_mailbox(get_gmail_service(), email_address, history_id)
+    except HttpError as exc:
+        # Revoked/rotated credentials: rebuild the cached client on the next push
+        if getattr(exc.resp, "status", None) == 401:
+            reset_gmail_service()
+        raise
+
+
+def _list_history_page(list_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # Runs on a prefetch thread, so it must use that thread's own client rather than the caller's
+    try:
+        return get_gmail_service().users().history().list(**list_kwargs).execute()
+    except HttpError as exc:
+        if getattr(exc.resp, "status", None) == 401:
+            reset_gmail_service()
+        raise
+
+
+def _batch_get_messages(service: Any, email_address: str, msg_ids: List[str]) -> Dict[str, Any]:
+    # messages.get for a whole history page in batched HTTP round trips; each id maps to its
+    # message resource or the exception Gmail returned for it
+    results: Dict[str, Any] = {}
 
-    service = build_gmail_service()
+    def _collect(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+        results[request_id] = exception if exception is not None else response
 
+    for start in range(0, len(msg_ids), _GET_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=_collect)
+        for msg_id in msg_ids[start:start + _GET_BATCH_SIZE]:
+            batch.add(
+                service.users().messages().get(userId=email_address, id=msg_id, format="full"),
+                request_id=msg_id,
+            )
+        batch.execute()
+    return results
+
+
+def _process_mailbox(service: Any, email_address: str, history_id: Any) -> Dict[str, Any]:
     start_history_id = get_last_history_id(email_address)
-    page_token = None
     processed = 0
     max_history_seen: Optional[int] = None
+    list_kwargs: Dict[str, Any] = {
+        "userId": email_address,
+        "startHistoryId": start_history_id or history_id,
+        "historyTypes": ["messageAdded"],
+        "labelId": "INBOX",
+    }
+    hist_resp = service.users().history().list(**list_kwargs).execute()
 
     while True:
-        list_kwargs: Dict[str, Any] = {
-            "userId": email_address,
-            "startHistoryId": start_history_id or history_id,
-            "historyTypes": ["messageAdded"],
-            "labelId": "INBOX",
-        }
-        if page_token:
-            list_kwargs["pageToken"] = page_token
-        hist_resp = service.users().history().list(**list_kwargs).execute()
+        page_token = hist_resp.get("nextPageToken")
+        # Overlap the next history.list round trip with processing this page
+        next_page: Optional[Future] = (
+            _history_prefetch.submit(_list_history_page, {**list_kwargs, "pageToken": page_token})
+            if page_token
+            else None
+        )
         histories = hist_resp.get("history", [])
+        page_messages: List[tuple[str, Optional[str]]] = []
         for h in histories:
             try:
                 hid = int(h.get("id")) if h.get("id") is not None else None
@@ -93,28 +200,46 @@ def process_pubsub_push(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
                 msg_id = msg_meta.get("id")
                 if not msg_id:
                     continue
-                if has_processed_message(email_address, msg_id):
-                    continue
-                msg = service.users().messages().get(userId=email_address, id=msg_id, format="full").execute()
-                label_ids = set(msg.get("labelIds", []))
-                if "INBOX" not in label_ids or "SENT" in label_ids:
+                page_messages.append((msg_id, msg_meta.get("threadId")))
+        # Claim the whole page in one write; messages skipped by the filters below stay claimed so
+        # they aren't re-fetched
+        claimed = claim_messages(email_address, page_messages) if page_messages else []
+        fetched: Dict[str, Any] = {}
+        if claimed:
+            try:
+                fetched = _batch_get_messages(service, email_address, claimed)
+            except Exception:
+                release_messages(email_address, claimed)
+                raise
+        for idx, msg_id in enumerate(claimed):
+            msg = fetched.get(msg_id)
+            if msg is None or isinstance(msg, Exception):
+                # Hand this and every later claim back so a redelivered push retries them
+                release_messages(email_address, claimed[idx:])
+                if isinstance(msg, Exception):
+                    raise msg
+                raise RuntimeError(f"gmail batch returned no result for message {msg_id}")
+            label_ids = set(msg.get("labelIds", []))
+            if "INBOX" not in label_ids or "SENT" in label_ids:
+                continue
+            payload = msg.get("payload", {})
+            hmap = _header_map(payload.get("headers", []))
+            thread_id = msg.get("threadId")
+            from_header = hmap.get("from")
+            # Parse printable name/email into plain email address
+            from_email = parseaddr(from_header or "")[1] if from_header else None
+            # Extract headers for proper threading and subject continuity
+            smtp_message_id = hmap.get("message-id")
+            subject_header = hmap.get("subject")
+            references_header = hmap.get("references")
+            if settings.gmail_process_replies_only:
+                in_reply_to = hmap.get("in-reply-to")
+                if not in_reply_to:
                     continue
-                payload = msg.get("payload", {})
-                headers = payload.get("headers", [])
-                thread_id = msg.get("threadId")
-                from_header = _get_header(headers, "From")
-                # Parse printable name/email into plain email address
-                from_email = parseaddr(from_header or "")[1] if from_header else None
-                # Extract headers for proper threading and subject continuity
-                smtp_message_id = _get_header(headers, "Message-Id") or _get_header(headers, "Message-ID")
-                subject_header = _get_header(headers, "Subject")
-                references_header = _get_header(headers, "References")
-                if settings.gmail_process_replies_only:
-                    in_reply_to = _get_header(headers, "In-Reply-To")
-                    if not in_reply_to:
-                        continue
-                body_text = _extract_plain_text(payload)
-                # Log agent invocation context (visible in terminal)
+            body_text = _extract_plain_text(payload)
+            # Log agent invocation context (visible in terminal); extras only built when emitted
+            log_info = logger.isEnabledFor(logging.INFO)
+            if log_info:
                 logger.info(
                     "gmail.invoke_agent",
                     extra={
@@ -124,6 +249,7 @@ def process_pubsub_push(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
                         "body_len": len(body_text or ""),
                     },
                 )
+            try:
                 result = run_reply_workflow(
                     thread_id=thread_id,
                     reply_email_body=body_text,
@@ -132,34 +258,33 @@ def process_pubsub_push(pubsub_body: Dict[str, Any]) -> Dict[str, Any]:
                     inbound_subject=subject_header,
                     inbound_references=references_header,
                 )
-                try:
-                    logger.info(
-                        "gmail.agent_result",
-                        extra={
-                            "thread_id": result.get("thread_id") or thread_id,
-                            "intent": result.get("classified_intent"),
-                            "has_send_result": bool(result.get("send_result")),
-                            "has_subject": bool(result.get("subject")),
-                        },
-                    )
-                except Exception:
-                    # Never let logging failures break processing
-                    pass
-                mark_processed_message(email_address, msg_id, thread_id)
-                # Ensure visibility even if logger config filters this module
-                try:
-                    print(
-                        f"[GMAIL] invoke_agent thread_id={thread_id} from={from_email} subject={subject_header} body_len={len(body_text or '')}",
-                        flush=True,
-                    )
-                except Exception:
-                    pass
-                processed += 1
-        page_token = hist_resp.get("nextPageToken")
-        if not page_token:
+            except Exception:
+                release_messages(email_address, claimed[idx:])
+                raise
+            if log_info:
+                logger.info(
+                    "gmail.agent_result",
+                    extra={
+                        "thread_id": result.get("thread_id") or thread_id,
+                        "intent": result.get("classified_intent"),
+                        "has_send_result": bool(result.get("send_result")),
+                        "has_subject": bool(result.get("subject")),
+                    },
+                )
+            # Ensure visibility even if logger config filters this module
+            try:
+                print(
+                    f"[GMAIL] invoke_agent thread_id={thread_id} from={from_email} subject={subject_header} body_len={len(body_text or '')}",
+                    flush=True,
+                )
+            except Exception:
+                pass
+            processed += 1
+        if next_page is None:
             break
+        hist_resp = next_page.result()
 
     next_checkpoint = str(max_history_seen) if max_history_seen is not None else str(history_id)
-    set_last_history_id(email_address, next_checkpoint)
+    queue_last_history_id(email_address, next_checkpoint)
 
     return {"ok": True, "processed": processed, "emailAddress": email_address, "historyId": history_id}
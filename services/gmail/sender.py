@@ -4,7 +4,7 @@ import base64
 from email.message import EmailMessage
 from typing import Optional
 
-from .client import build_gmail_service
+from .client import get_gmail_service
 
 
 def send_gmail_message(
@@ -17,7 +17,7 @@ def send_gmail_message(
     references: Optional[str] = None,
     from_email: Optional[str] = None,
 ) -> dict:
-    service = build_gmail_service()
+    service = get_gmail_service()
 
     msg = EmailMessage()
     msg["To"] = to_email
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_TIMEOUT = 20
+
+
+@lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    # Shared keep-alive session so outbound API calls (Twilio, Vapi) reuse pooled connections
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
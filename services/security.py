@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import hashlib
+import threading
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-import re
 
 import logging
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -12,8 +14,7 @@ from passlib.context import CryptContext
 from pydantic import EmailStr
 
 from core.config import settings
-from db.database import get_database
-from repositories.base import BaseRepository
+from db.database import EMAIL_COLLATION, get_repo
 from models.role import Role
 
 
@@ -21,9 +22,21 @@ password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 logger = logging.getLogger(__name__)
 
+# Recent successful (sha256(plain), hash) pairs so repeated logins skip bcrypt; failures are never cached,
+# and the short TTL means a changed password stops matching within a minute
+_verified_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+_verified_cache_lock = threading.Lock()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
+    cache_key = (hashlib.sha256((plain_password or "").encode("utf-8")).digest(), hashed_password)
+    with _verified_cache_lock:
+        if cache_key in _verified_cache:
+            return True
     ok = password_context.verify(plain_password, hashed_password)
+    if ok:
+        with _verified_cache_lock:
+            _verified_cache[cache_key] = True
     # Debug log only in development
     if settings.environment == "development":
         logger.info(
@@ -37,6 +50,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return ok
 
 
+def dummy_verify_password() -> None:
+    # Burn a bcrypt verify for unknown users so response time does not reveal account existence
+    password_context.dummy_verify()
+
+
 def get_password_hash(password: str) -> str:
     hashed = password_context.hash(password)
     if settings.environment == "development":
@@ -61,15 +79,15 @@ async def get_user_by_email(email: str) -> Optional[Role]:
         "auth.db_resolved",
         extra={"mongo_uri": settings.mongo_uri, "database": settings.database_name, "collection": "roles"},
     )
-    db = await get_database()
-    repo = BaseRepository(db)
-    # Case-insensitive exact match on email to avoid login failures due to casing
-    email_ci = {"$regex": f"^{re.escape(str(email))}$", "$options": "i"}
-    doc = await repo.find_one("roles", {"email": email_ci})
+    repo = await get_repo()
+    # Case-insensitive exact match on email to avoid login failures due to casing; the collation
+    # matches the roles.email index, so this is an index lookup rather than a regex collection scan
+    doc = await repo.find_one("roles", {"email": str(email)}, collation=EMAIL_COLLATION)
     if not doc:
         logger.warning("auth.user_not_found", extra={"email": email})
         return None
-    return Role(**doc)
+    # Stored role docs were validated on write; skip re-validation on every authenticated request
+    return Role.model_construct(**doc)
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Role:
@@ -96,11 +114,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Role:
 
 
 async def create_initial_admin_if_missing(name: str, email: EmailStr, role: str, password: str) -> Role:
-    db = await get_database()
-    repo = BaseRepository(db)
-    existing = await repo.find_one("roles", {"email": str(email)})
+    repo = await get_repo()
+    existing = await repo.find_one("roles", {"email": str(email)}, collation=EMAIL_COLLATION)
     if existing:
-        return Role(**existing)
+        return Role.model_construct(**existing)
     hashed = get_password_hash(password)
     doc = {"name": name, "email": str(email), "role": role, "hashed_password": hashed}
     inserted_id = await repo.insert_one("roles", doc)